@@ -1,10 +1,20 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Union
+from collections import OrderedDict
 import random
-from train.model_sampler import Sampler
-from google import genai
+from train.model_sampler import Sampler, MAX_HEATMAP_CELLS, heatmap_cells
+from train.model_registry import ModelRegistry, MODEL_REGISTRY_DIR, MODEL_MEMORY_BUDGET_MB
+from train.model_reloader import ModelReloader, MODEL_RELOAD_INTERVAL
+from train.inference_backends import configure_threads
+from train.prediction_cache import PredictionCache, PREDICTION_CACHE_SIZE, PREDICTION_CACHE_GRID, PREDICTION_CACHE_TTL
+from concurrent.futures import ThreadPoolExecutor
+from llm_client import GeminiClient, FenceStripper, ResponseCache
+from micro_batcher import MicroBatcher, MICRO_BATCHING
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
 import os
 import re
 
@@ -20,18 +30,219 @@ app.add_middleware(
 )
 
 api_key = os.getenv("GEMINI_API_KEY")  # or replace with your key string
-client = genai.Client(api_key=api_key)
+# Async client with a shared session, per-call timeout and in-flight cap (see llm_client.py)
+gemini = GeminiClient(api_key=api_key, model='gemini-3-flash-preview')
+
+# Repeat requests (same model, prompt and code) are answered from here instead of paying for another call
+response_cache = ResponseCache()
+
+@app.on_event("shutdown")
+async def close_gemini():
+    await gemini.aclose()
 
 class HitRequest(BaseModel):
     x: Optional[float]
     y: Optional[float]
     div_id: Optional[str]
-    predict_other: Optional[Dict[str, Any]]
+    predict_other: Optional[Dict[str, Any]] = None
+    # repoId of the DarwinTracker the element belongs to; the default model if omitted
+    repo_id: Optional[str] = None
+
+class HitBatchRequest(BaseModel):
+    queries: List[HitRequest]
+    repo_id: Optional[str] = None
+
+class HeatmapRequest(BaseModel):
+    div_id: str
+    width: int = 1920
+    height: int = 1080
+    step: int = 20
+    predict_other: Optional[Dict[str, Any]] = None
+    repo_id: Optional[str] = None
+
+class PageStateRequest(BaseModel):
+    # JSX source of the page to edit; the reference page if omitted
+    page: Optional[str] = None
+    # The page is scored by this repo's model for as long as it is open
+    repo_id: Optional[str] = None
+
+class StyleUpdateRequest(BaseModel):
+    div_id: str
+    prop: str
+    # None or "" removes the property
+    value: Optional[Union[float, str]] = None
+    x: float
+    y: float
 
 class RunPipelineRequest(BaseModel):
     html: str
 
-sampler = Sampler()
+# Model inference runs on its own small thread pool so a slow forward pass never
+# blocks the event loop (health checks, /api/generate_code, ...)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", "1"))
+configure_threads(TORCH_THREADS)
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+
+# Repeated hit-count requests (same div, same spot on a PREDICTION_CACHE_GRID px grid, same
+# overrides) are answered from this cache; it is tied to the loaded model and empties on reload
+prediction_cache = PredictionCache(
+    max_entries=int(os.getenv("PREDICTION_CACHE_SIZE", PREDICTION_CACHE_SIZE)),
+    grid=float(os.getenv("PREDICTION_CACHE_GRID", PREDICTION_CACHE_GRID)),
+    ttl=float(os.getenv("PREDICTION_CACHE_TTL", PREDICTION_CACHE_TTL)),
+)
+
+# SAMPLER_BACKEND is one of train.inference_backends.BACKENDS: 'torch' (default), 'torchscript', 'compile', 'onnx',
+# 'numpy' for the torch-free engine in train/numpy_engine.py or 'quantized' for the int8 model from train/quantize.py
+# MODEL_ARTIFACT overrides the model file, e.g. train/model_artifact_student.pt for the distilled Predictor
+def load_sampler(cache=None):
+    return Sampler(artifact_path=os.getenv("MODEL_ARTIFACT"), backend=os.getenv("SAMPLER_BACKEND", "torch"), cache=cache)
+
+# Always read through this global (once per request): a model reload replaces it with a new Sampler
+sampler = load_sampler(cache=prediction_cache)
+
+def make_prediction_cache():
+    return PredictionCache(max_entries=prediction_cache.max_entries, grid=prediction_cache.grid, ttl=prediction_cache.ttl)
+
+# Sites with their own model (MODEL_REGISTRY_DIR/<repo id>/model_artifact.pt) are served by it, loaded on
+# first use and evicted least recently used first past MODEL_MEMORY_BUDGET_MB; the rest use sampler above
+models = ModelRegistry(
+    sampler,
+    root=os.getenv("MODEL_REGISTRY_DIR", MODEL_REGISTRY_DIR),
+    budget_bytes=int(float(os.getenv("MODEL_MEMORY_BUDGET_MB", MODEL_MEMORY_BUDGET_MB)) * 1024 * 1024),
+    backend=os.getenv("SAMPLER_BACKEND", "torch"),
+    make_cache=make_prediction_cache,
+)
+
+# page_id -> repo_id the page was opened for, so its style edits are scored by the same model as
+# its hit counts; oldest entries are dropped past PAGE_REPO_LIMIT (each Sampler keeps fewer pages than that)
+page_repos = OrderedDict()
+PAGE_REPO_LIMIT = 4096
+
+async def run_inference(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_executor, fn, *args)
+
+# A newer artifact at the served path (checked every MODEL_RELOAD_INTERVAL seconds, or on
+# POST /api/model/reload) is loaded and warmed in the background, then swapped in
+reloader = ModelReloader(load_sampler, sampler.artifact_path)
+MODEL_RELOAD_INTERVAL_S = float(os.getenv("MODEL_RELOAD_INTERVAL", MODEL_RELOAD_INTERVAL))
+reload_lock = asyncio.Lock()
+# Required as the X-Admin-Token header of /api/model/reload when set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+class PageEditGate():
+    '''
+    Counts page opens and style edits in flight, and lets a model swap hold new ones back
+    while it waits for those to finish
+    '''
+    def __init__(self):
+        self.active = 0
+        self.opened = asyncio.Event()
+        self.opened.set()
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    async def __aenter__(self):
+        await self.opened.wait()
+        self.active += 1
+        self.idle.clear()
+
+    async def __aexit__(self, *exc):
+        self.active -= 1
+        if self.active == 0:
+            self.idle.set()
+
+    async def close(self):
+        self.opened.clear()
+        await self.idle.wait()
+
+    def open(self):
+        self.opened.set()
+
+page_edits = PageEditGate()
+
+async def swap_sampler(new):
+    global sampler
+    old = sampler
+    # Re-encoding the open pages for the new model runs off the event loop while the old one keeps serving
+    versions = await run_inference(new.pages.carry_over, old.pages, new.encoder)
+    await page_edits.close()
+    try:
+        # Only pages opened or edited during the copy above are copied again, with page edits held back
+        await run_inference(new.pages.carry_over, old.pages, new.encoder, versions)
+        # Bind before swapping: predictions old requests finish with from here on are no longer cached
+        new.cache = prediction_cache
+        prediction_cache.bind(new.model_version)
+        sampler = new
+        models.default = new
+    finally:
+        page_edits.open()
+    print(f"Model reloaded: {old.model_version} -> {new.model_version}")
+
+async def reload_model(force=False):
+    '''
+    Returns True if a different model was swapped in
+    '''
+    async with reload_lock:
+        # Loading runs on the default pool, not inference_executor, so it doesn't hold up predictions
+        new = await asyncio.get_running_loop().run_in_executor(None, reloader.reload, force)
+        if new is None or new.model_version == sampler.model_version:
+            return False
+        await swap_sampler(new)
+        return True
+
+async def watch_model():
+    while True:
+        await asyncio.sleep(MODEL_RELOAD_INTERVAL_S)
+        # Repos that got a model of their own since the last tick are served by it from now on
+        models.forget_missing()
+        if not reloader.changed():
+            continue
+        try:
+            await reload_model()
+        except Exception as error:
+            print(f"Model reload failed, still serving {sampler.model_version}: {error}")
+
+model_watcher = None
+
+@app.on_event("startup")
+async def start_model_watcher():
+    global model_watcher
+    if MODEL_RELOAD_INTERVAL_S > 0:
+        model_watcher = asyncio.create_task(watch_model())
+
+@app.on_event("shutdown")
+async def stop_model_watcher():
+    if model_watcher is not None:
+        model_watcher.cancel()
+
+# Opt-in (MICRO_BATCHING=1): concurrent /api/get_hit_count requests share one forward pass
+batcher = MicroBatcher(lambda features: sampler.predict(features), executor=inference_executor) if MICRO_BATCHING else None
+
+async def sample_hit_count(current, x, y, div_id, predict_other):
+    if batcher is None:
+        return await run_inference(current.sample, x, y, div_id, predict_other)
+
+    # Same steps as Sampler.sample, with the forward pass handed to the batcher
+    if current.cache is not None:
+        key, x, y = current.cache.key(x, y, div_id, predict_other)
+        count = current.cache.get(key)
+        if count is not None:
+            return count
+
+    features = current.build_features(x, y, div_id, predict_other, current.reference_rows())
+    # Rows go through the model the request started on, even if a reload swapped it meanwhile
+    count = max(0, await batcher.submit(features, current.predict))
+
+    if current.cache is not None:
+        current.cache.put(key, count, current.model_version)
+    return count
+
+@app.on_event("shutdown")
+async def close_batcher():
+    if batcher is not None:
+        await batcher.close()
 
 @app.get("/")
 async def health():
@@ -39,11 +250,85 @@ async def health():
 
 @app.post('/api/get_hit_count')
 async def get_hit_count(body: HitRequest):
-    count = int(sampler.sample(body.x, body.y, body.div_id, body.predict_other))
+    # Loading a repo's model for the first time reads it from disk, keep that off the event loop
+    current = await run_inference(models.get, body.repo_id)
+    count = int(await sample_hit_count(current, body.x, body.y, body.div_id, body.predict_other))
     # predict_other
     # count = int(nn_model(predict_x=body.x, predict_y=body.y, predict_id=body.div_id))
     print(count)
-    return {"count": count}
+    return {"count": count, "model_version": current.model_version}
+
+@app.get('/api/get_hit_count/stats')
+async def get_hit_count_stats():
+    return {"cache": prediction_cache.stats(), "batcher": batcher.stats() if batcher is not None else None, "models": models.stats()}
+
+@app.get('/api/model')
+async def model_info():
+    current = sampler
+    return {"model_version": current.model_version, "backend": current.backend, "reloader": reloader.stats()}
+
+@app.post('/api/model/reload')
+async def reload_model_now(x_admin_token: Optional[str] = Header(None)):
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    models.forget_missing()
+    try:
+        reloaded = await reload_model(force=True)
+    except Exception as error:
+        raise HTTPException(status_code=500, detail=f"Model reload failed, still serving {sampler.model_version}: {error}")
+    return {"reloaded": reloaded, "model_version": sampler.model_version}
+
+@app.post('/api/get_hit_counts')
+async def get_hit_counts(body: HitBatchRequest):
+    queries = [(q.x, q.y, q.div_id, q.predict_other) for q in body.queries]
+    current = await run_inference(models.get, body.repo_id)
+    # Elements the model doesn't know get a null count instead of failing the whole batch
+    unknown = current.unknown_div_ids([q.div_id for q in body.queries])
+    known = [i for i, query in enumerate(queries) if query[2] not in unknown]
+    counts = [None] * len(queries)
+    for i, count in zip(known, await run_inference(current.sample_batch, [queries[i] for i in known])):
+        counts[i] = int(count)
+    return {"counts": counts, "model_version": current.model_version, "unknown_div_ids": unknown}
+
+@app.post('/api/hit_heatmap')
+async def hit_heatmap(body: HeatmapRequest):
+    if body.step <= 0 or body.width <= 0 or body.height <= 0:
+        raise HTTPException(status_code=400, detail="width, height and step must be positive")
+    cells = heatmap_cells(body.width, body.height, body.step)
+    if cells > MAX_HEATMAP_CELLS:
+        raise HTTPException(status_code=400, detail=f"Grid has {cells} cells, at most {MAX_HEATMAP_CELLS} are allowed; use a larger step")
+
+    current = await run_inference(models.get, body.repo_id)
+    if current.unknown_div_ids([body.div_id]):
+        raise HTTPException(status_code=400, detail=f"Unknown div_id: {body.div_id}")
+    grid = await run_inference(current.heatmap, body.div_id, body.predict_other, body.width, body.height, body.step)
+    # Row i, column j holds the predicted hits with the element at (j * step, i * step)
+    return {"step": body.step, "width": body.width, "height": body.height, "hits": grid.round().astype(int).tolist(),
+            "model_version": current.model_version}
+
+@app.post('/api/page_state')
+async def open_page_state(body: PageStateRequest):
+    async with page_edits:
+        current = await run_inference(models.get, body.repo_id)
+        page_id, div_ids = await run_inference(current.open_page, body.page)
+    page_repos[page_id] = body.repo_id
+    while len(page_repos) > PAGE_REPO_LIMIT:
+        page_repos.popitem(last=False)
+    return {"page_id": page_id, "div_ids": div_ids, "model_version": current.model_version}
+
+@app.post('/api/page_state/{page_id}/style')
+async def update_page_style(page_id: str, body: StyleUpdateRequest):
+    if page_id not in page_repos:
+        raise HTTPException(status_code=404, detail=f"Unknown page or element: '{page_id}'")
+    # Through the registry rather than a stored Sampler: a reload replaces the default one (pages carry over)
+    # A model swap waits for edits in flight and holds new ones back while it copies the last edited pages
+    async with page_edits:
+        current = await run_inference(models.get, page_repos[page_id])
+        try:
+            count = await run_inference(current.update_page, page_id, body.div_id, body.prop, body.value, body.x, body.y)
+        except KeyError as error:
+            raise HTTPException(status_code=404, detail=f"Unknown page or element: {error}")
+    return {"div_id": body.div_id, "count": int(count), "model_version": current.model_version}
 
 # Request body schema
 class GenerateCodeRequest(BaseModel):
@@ -51,31 +336,89 @@ class GenerateCodeRequest(BaseModel):
     code: str
 
 
-@app.post("/api/generate_code")
-async def generate_code(request: GenerateCodeRequest):
-    try:
-        full_prompt = f"""
+def build_prompt(request):
+    return f"""
         You are an expert React developer.
         Update this App.jsx code based on this request: "{request.prompt}"
         EXISTING CODE: {request.code}
         Return ONLY the raw code string. No markdown.
         """
 
-        response = client.models.generate_content(
-            model='gemini-3-flash-preview',
-            contents=full_prompt)
-        text = response.text
 
-        # Remove markdown code fences if present
-        cleaned_code = re.sub(r"```jsx|```", "", text).strip()
+async def generate_cleaned_code(full_prompt):
+    text = await gemini.generate(full_prompt)
+
+    # Remove markdown code fences if present
+    return re.sub(r"```jsx|```", "", text).strip()
+
+
+@app.post("/api/generate_code")
+async def generate_code(request: GenerateCodeRequest):
+    try:
+        full_prompt = build_prompt(request)
+        key = ResponseCache.key(gemini.model, request.prompt, request.code)
+
+        cleaned_code = await response_cache.get_or_compute(key, lambda: generate_cleaned_code(full_prompt))
 
         return {"code": cleaned_code}
 
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Gemini did not respond within {gemini.timeout} seconds")
+
     except Exception as error:
         print("❌ SERVER CRASH DETAILS:")
         print("Message:", str(error))
         raise HTTPException(status_code=500, detail=str(error))
 
+
+async def generate_cleaned_stream(full_prompt):
+    stripper = FenceStripper()
+    async for chunk in gemini.generate_stream(full_prompt):
+        text = stripper.feed(chunk)
+        if text:
+            yield text
+
+    text = stripper.finish()
+    if text:
+        yield text
+
+
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@app.post("/api/generate_code_stream")
+async def generate_code_stream(request: GenerateCodeRequest):
+    '''
+    Same as /api/generate_code, but sends the code as server-sent events while Gemini writes it:
+    "data: {"text": ...}" for each chunk, then "event: done" (or "event: error" with a detail)
+    Identical requests in flight at the same time share one Gemini stream (ResponseCache.subscribe).
+    '''
+    full_prompt = build_prompt(request)
+    key = ResponseCache.key(gemini.model, request.prompt, request.code)
+
+    async def events():
+        try:
+            async for text in response_cache.subscribe(key, lambda: generate_cleaned_stream(full_prompt)):
+                yield sse_event({"text": text})
+            yield sse_event({}, event="done")
+
+        except asyncio.TimeoutError:
+            yield sse_event({"detail": f"Gemini did not respond within {gemini.timeout} seconds"}, event="error")
+
+        except Exception as error:
+            print("❌ STREAM ERROR:", str(error))
+            yield sse_event({"detail": str(error)}, event="error")
+
+    # X-Accel-Buffering stops reverse proxies from holding the stream back until it ends
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/generate_code/stats")
+async def generate_code_stats():
+    return {"cache": response_cache.stats(), "gemini": gemini.stats()}
+
 if __name__ == '__main__':
     import uvicorn
     uvicorn.run(app, host='0.0.0.0', port=8001)
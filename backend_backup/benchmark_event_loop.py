@@ -0,0 +1,80 @@
+'''
+Measures how much concurrent model inference delays the event loop
+
+Fires CONCURRENT_REQUESTS heatmap requests at the app while probing the loop every
+PROBE_INTERVAL seconds, once with inference run inline on the loop (the old behaviour)
+and once through the inference thread pool.
+
+Run from backend_backup/ with: python benchmark_event_loop.py
+'''
+import asyncio
+import time
+import httpx
+import numpy as np
+import api
+
+CONCURRENT_REQUESTS = 16
+PROBE_INTERVAL = 0.01
+HEATMAP_BODY = {"div_id": "btn-cta-2", "step": 20}
+
+
+async def run_inline(fn, *args):
+    return fn(*args)
+
+
+async def probe_loop(lags, stop):
+    # How late each wakeup is tells us how long the loop was blocked
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append((time.perf_counter() - start - PROBE_INTERVAL) * 1000)
+
+
+async def run_load():
+    lags = []
+    health_latencies = []
+    stop = asyncio.Event()
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        async def health_checks():
+            while not stop.is_set():
+                start = time.perf_counter()
+                await client.get("/")
+                health_latencies.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(PROBE_INTERVAL)
+
+        probe = asyncio.create_task(probe_loop(lags, stop))
+        health = asyncio.create_task(health_checks())
+
+        start = time.perf_counter()
+        await asyncio.gather(*[client.post("/api/hit_heatmap", json=HEATMAP_BODY) for _ in range(CONCURRENT_REQUESTS)])
+        elapsed = time.perf_counter() - start
+
+        stop.set()
+        await asyncio.gather(probe, health)
+
+    return elapsed, lags, health_latencies
+
+
+def report(name, elapsed, lags, health_latencies):
+    print(f"{name:<10} total {elapsed:6.2f}s | loop lag p50 {np.percentile(lags, 50):7.2f}ms "
+          f"p99 {np.percentile(lags, 99):7.2f}ms max {max(lags):7.2f}ms | "
+          f"health p99 {np.percentile(health_latencies, 99):7.2f}ms ({len(health_latencies)} checks)")
+
+
+def main():
+    print(f"{CONCURRENT_REQUESTS} concurrent /api/hit_heatmap requests, "
+          f"{api.INFERENCE_WORKERS} inference workers, {api.TORCH_THREADS} torch threads")
+
+    executor_run_inference = api.run_inference
+
+    api.run_inference = run_inline
+    report("inline", *asyncio.run(run_load()))
+
+    api.run_inference = executor_run_inference
+    report("executor", *asyncio.run(run_load()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+'''
+Throughput and latency of /api/get_hit_count with and without the micro-batcher
+
+Sends TOTAL_REQUESTS requests, CONCURRENCY at a time, each at a different position so the
+prediction cache never answers them.
+
+Run from backend_backup/ with: python benchmark_micro_batching.py
+'''
+import asyncio
+import contextlib
+import io
+import time
+import httpx
+import numpy as np
+import api
+from micro_batcher import MicroBatcher
+
+TOTAL_REQUESTS = 1024
+CONCURRENCY = 64
+
+
+async def run_load():
+    latencies = []
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        async def one(i):
+            body = {"x": i % 400, "y": i // 400 * 10, "div_id": "btn-cta"}
+            async with semaphore:
+                start = time.perf_counter()
+                await client.post("/api/get_hit_count", json=body)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[one(i) for i in range(TOTAL_REQUESTS)])
+        elapsed = time.perf_counter() - start
+
+    return elapsed, latencies
+
+
+def report(name, elapsed, latencies):
+    print(f"{name:<22} {TOTAL_REQUESTS / elapsed:8.0f} req/s | latency p50 {np.percentile(latencies, 50):7.2f}ms "
+          f"p99 {np.percentile(latencies, 99):7.2f}ms")
+
+
+def main():
+    api.sampler.cache = None
+    print(f"{TOTAL_REQUESTS} requests, {CONCURRENCY} concurrent, {api.INFERENCE_WORKERS} inference workers")
+
+    runs = [("unbatched", None)]
+    for max_batch_size, max_wait_ms in [(64, 1), (64, 5)]:
+        batcher = MicroBatcher(lambda features: api.sampler.predict(features), executor=api.inference_executor,
+                               max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+        runs.append((f"batched {max_batch_size}/{max_wait_ms}ms", batcher))
+
+    for name, batcher in runs:
+        api.batcher = batcher
+        # get_hit_count prints every count, keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = asyncio.run(run_load())
+        report(name, *result)
+        if batcher is not None:
+            print(f"{'':<22} {batcher.stats()}")
+            # The worker task belonged to the loop asyncio.run just closed
+            batcher.worker = None
+
+
+if __name__ == '__main__':
+    main()
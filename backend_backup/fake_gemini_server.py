@@ -0,0 +1,73 @@
+'''
+Stand-in for the Gemini API so /api/generate_code can be exercised locally
+
+Run with: python fake_gemini_server.py
+Then start the backend with GEMINI_BASE_URL=http://localhost:8002 GEMINI_API_KEY=fake
+'''
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
+import os
+
+app = FastAPI()
+
+# Seconds each fake generation takes, to exercise timeouts and the in-flight cap
+FAKE_DELAY = float(os.getenv("FAKE_GEMINI_DELAY", "1.0"))
+FAKE_CODE = "export default function App() {\n  return <div>Generated by the fake Gemini server</div>;\n}"
+
+calls = {"total": 0, "in_flight": 0, "max_in_flight": 0}
+
+
+def fake_response(text):
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": "STOP",
+        }]
+    }
+
+
+@app.post("/{api_version}/models/{model}:generateContent")
+async def generate_content(api_version: str, model: str, request: Request):
+    await request.json()
+    calls["total"] += 1
+    calls["in_flight"] += 1
+    calls["max_in_flight"] = max(calls["max_in_flight"], calls["in_flight"])
+    try:
+        await asyncio.sleep(FAKE_DELAY)
+        return fake_response(f"```jsx\n{FAKE_CODE}\n```")
+    finally:
+        calls["in_flight"] -= 1
+
+
+@app.post("/{api_version}/models/{model}:streamGenerateContent")
+async def stream_generate_content(api_version: str, model: str, request: Request):
+    await request.json()
+    calls["total"] += 1
+
+    # Split the reply into small pieces (cutting through the fences on purpose)
+    text = f"```jsx\n{FAKE_CODE}\n```"
+    pieces = [text[i:i + 7] for i in range(0, len(text), 7)]
+
+    async def events():
+        calls["in_flight"] += 1
+        calls["max_in_flight"] = max(calls["max_in_flight"], calls["in_flight"])
+        try:
+            for piece in pieces:
+                await asyncio.sleep(FAKE_DELAY / len(pieces))
+                yield f"data: {json.dumps(fake_response(piece))}\r\n\r\n"
+        finally:
+            calls["in_flight"] -= 1
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/stats")
+async def stats():
+    return calls
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=8002)
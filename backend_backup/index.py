@@ -1,17 +1,21 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional, Dict, Any
+from fastapi.responses import StreamingResponse
+from typing import Optional, Dict, Any, List
+import asyncio
+import json
 import os
 import re
-from google import genai
 
 # IMPORTANT: Because we moved the folder, we import from .train
 # If this fails locally, use 'try: from train...' but for Vercel use .train
 try:
     from .train.model_sampler import Sampler
+    from .llm_client import GeminiClient, FenceStripper
 except ImportError:
     from train.model_sampler import Sampler
+    from llm_client import GeminiClient, FenceStripper
 
 app = FastAPI()
 
@@ -27,12 +31,18 @@ app.add_middleware(
 # Initialize Gemini
 # Ensure GEMINI_API_KEY is set in Vercel Project Settings
 api_key = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key)
+# Async client with a shared session, per-call timeout and in-flight cap (see llm_client.py)
+gemini = GeminiClient(api_key=api_key, model='gemini-2.0-flash')
+
+@app.on_event("shutdown")
+async def close_gemini():
+    await gemini.aclose()
 
 # Initialize Sampler
-# If Torch is too big for Vercel, this block will cause the crash.
+# Torch is too big for Vercel, so serve through the numpy engine by default.
+# Run train/numpy_engine.py to export model_weights.npz before deploying.
 try:
-    sampler = Sampler()
+    sampler = Sampler(backend=os.getenv("SAMPLER_BACKEND", "numpy"))
     print("✅ Model Sampler Loaded")
 except Exception as e:
     print(f"⚠️ Model Sampler Failed to Load: {e}")
@@ -42,12 +52,24 @@ class HitRequest(BaseModel):
     x: Optional[float]
     y: Optional[float]
     div_id: Optional[str]
-    predict_other: Optional[Dict[str, Any]]
+    predict_other: Optional[Dict[str, Any]] = None
+
+class HitBatchRequest(BaseModel):
+    queries: List[HitRequest]
 
 class GenerateCodeRequest(BaseModel):
     prompt: str
     code: str
 
+
+def build_prompt(request):
+    return f"""
+        You are an expert React developer.
+        Update this App.jsx code based on this request: "{request.prompt}"
+        EXISTING CODE: {request.code}
+        Return ONLY the raw code string. No markdown.
+        """
+
 @app.get("/api/health")
 async def health():
     return {"status": "ok", "backend": "FastAPI on Vercel"}
@@ -64,29 +86,76 @@ async def get_hit_count(body: HitRequest):
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post('/api/get_hit_counts')
+async def get_hit_counts(body: HitBatchRequest):
+    if sampler is None:
+        return {"counts": [0] * len(body.queries), "error": "Model could not be loaded on Vercel (Size Limit)"}
+
+    try:
+        queries = [(q.x, q.y, q.div_id, q.predict_other) for q in body.queries]
+        # Elements the model doesn't know get a null count instead of failing the whole batch
+        unknown = sampler.unknown_div_ids([q.div_id for q in body.queries])
+        known = [i for i, query in enumerate(queries) if query[2] not in unknown]
+        counts = [None] * len(queries)
+        for i, count in zip(known, sampler.sample_batch([queries[i] for i in known])):
+            counts[i] = int(count)
+        return {"counts": counts, "unknown_div_ids": unknown}
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/generate_code")
 async def generate_code(request: GenerateCodeRequest):
     try:
-        full_prompt = f"""
-        You are an expert React developer.
-        Update this App.jsx code based on this request: "{request.prompt}"
-        EXISTING CODE: {request.code}
-        Return ONLY the raw code string. No markdown.
-        """
-
-        # Using a stable model version
-        response = client.models.generate_content(
-            model='gemini-2.0-flash', 
-            contents=full_prompt
-        )
-        text = response.text
+        text = await gemini.generate(build_prompt(request))
 
         # Clean markdown
         cleaned_code = re.sub(r"```jsx|```", "", text).strip()
         return {"code": cleaned_code}
 
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Gemini did not respond within {gemini.timeout} seconds")
+
     except Exception as error:
         print(f"Gemini Error: {str(error)}")
         raise HTTPException(status_code=500, detail=str(error))
 
+
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@app.post("/api/generate_code_stream")
+async def generate_code_stream(request: GenerateCodeRequest):
+    '''
+    Same as /api/generate_code, but sends the code as server-sent events while Gemini writes it:
+    "data: {"text": ...}" for each chunk, then "event: done" (or "event: error" with a detail)
+    '''
+    full_prompt = build_prompt(request)
+
+    async def events():
+        stripper = FenceStripper()
+        try:
+            async for chunk in gemini.generate_stream(full_prompt):
+                text = stripper.feed(chunk)
+                if text:
+                    yield sse_event({"text": text})
+
+            text = stripper.finish()
+            if text:
+                yield sse_event({"text": text})
+            yield sse_event({}, event="done")
+
+        except asyncio.TimeoutError:
+            yield sse_event({"detail": f"Gemini did not respond within {gemini.timeout} seconds"}, event="error")
+
+        except Exception as error:
+            print("Gemini Stream Error:", str(error))
+            yield sse_event({"detail": str(error)}, event="error")
+
+    # X-Accel-Buffering stops reverse proxies from holding the stream back until it ends
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # Note: No 'uvicorn.run' block needed for Vercel
\ No newline at end of file
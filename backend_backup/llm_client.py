@@ -0,0 +1,306 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+import httpx
+from google import genai
+from google.genai import types
+
+# Seconds before a single generate call is abandoned
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+# Calls allowed upstream at once, the rest wait their turn
+GEMINI_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "4"))
+# Point this at a local fake server (see fake_gemini_server.py) to test without the real API
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
+# Generated responses kept for repeat requests, and for how many seconds
+GENERATE_CACHE_SIZE = int(os.getenv("GENERATE_CACHE_SIZE", "256"))
+GENERATE_CACHE_TTL = float(os.getenv("GENERATE_CACHE_TTL", "3600"))
+
+
+class GeminiClient():
+    '''
+    Async wrapper around the genai client used by /api/generate_code
+
+    One instance is shared by the whole app so every call reuses the same pooled
+    HTTP session instead of opening a new connection per request.
+    '''
+    def __init__(self, api_key, model, timeout=GEMINI_TIMEOUT, max_in_flight=GEMINI_MAX_IN_FLIGHT, base_url=GEMINI_BASE_URL):
+        self.model = model
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+
+        self.session = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight),
+        )
+        http_options = types.HttpOptions(base_url=base_url, timeout=int(timeout * 1000), httpx_async_client=self.session)
+        self.client = genai.Client(api_key=api_key, http_options=http_options)
+
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.queued = 0
+
+    async def generate(self, prompt):
+        '''
+        Returns the generated text. Waits for a free slot if max_in_flight calls are already running.
+        Raises asyncio.TimeoutError if the upstream call takes longer than self.timeout seconds.
+        '''
+        self.queued += 1
+        async with self.semaphore:
+            self.queued -= 1
+            self.in_flight += 1
+            try:
+                response = await asyncio.wait_for(
+                    self.client.aio.models.generate_content(model=self.model, contents=prompt),
+                    timeout=self.timeout,
+                )
+                return response.text
+            finally:
+                self.in_flight -= 1
+
+    async def generate_stream(self, prompt):
+        '''
+        Yields the generated text chunk by chunk as Gemini produces it.
+        Holds an in-flight slot for the whole stream; self.timeout bounds the entire stream, not each chunk.
+        '''
+        self.queued += 1
+        async with self.semaphore:
+            self.queued -= 1
+            self.in_flight += 1
+            try:
+                deadline = time.monotonic() + self.timeout
+                stream = await asyncio.wait_for(
+                    self.client.aio.models.generate_content_stream(model=self.model, contents=prompt),
+                    timeout=self.timeout,
+                )
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), timeout=deadline - time.monotonic())
+                    except StopAsyncIteration:
+                        break
+                    if chunk.text:
+                        yield chunk.text
+            finally:
+                self.in_flight -= 1
+
+    def stats(self):
+        return {"in_flight": self.in_flight, "queued": self.queued, "max_in_flight": self.max_in_flight}
+
+    async def aclose(self):
+        await self.session.aclose()
+
+
+class FenceStripper():
+    '''
+    Streaming version of re.sub(r"```jsx|```", "", text).strip()
+
+    feed() returns the cleaned text that is safe to emit so far. A tail that could still turn
+    into a fence (a run of backticks, optionally followed by "j" or "js") and any trailing
+    whitespace are held back until more text arrives or finish() is called.
+    '''
+    def __init__(self):
+        self.pending = ""
+        self.trailing = ""
+        self.started = False
+
+    def feed(self, text):
+        self.pending += text
+
+        partial = re.search(r"`+(j|js)?$", self.pending)
+        split = partial.start() if partial else len(self.pending)
+
+        head = self.pending[:split]
+        self.pending = self.pending[split:]
+        return self.emit(re.sub(r"```jsx|```", "", head))
+
+    def finish(self):
+        text = self.emit(re.sub(r"```jsx|```", "", self.pending))
+        self.pending = ""
+        self.trailing = ""
+        return text
+
+    def emit(self, cleaned):
+        if not self.started:
+            cleaned = cleaned.lstrip()
+            if not cleaned:
+                return ""
+            self.started = True
+
+        text = self.trailing + cleaned
+        body = text.rstrip()
+        self.trailing = text[len(body):]
+        return body
+
+
+class SharedStream():
+    '''
+    One upstream stream of text chunks read once and fanned out to any number of subscribers
+
+    The source is read by its own task, so a subscriber disconnecting doesn't stop it for the others.
+    Subscribers that join late get the chunks sent so far replayed first.
+    '''
+    def __init__(self, source):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self.run(source))
+
+    async def run(self, source):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self.notify()
+        except (Exception, asyncio.CancelledError) as error:
+            self.error = error
+        finally:
+            self.done = True
+            self.notify()
+
+    def notify(self):
+        # Wake everyone waiting on the current event, later waits use a fresh one
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    async def subscribe(self):
+        '''
+        Yields every chunk of the stream from the start; raises the source's error if it failed
+        '''
+        sent = 0
+        while True:
+            while sent < len(self.chunks):
+                yield self.chunks[sent]
+                sent += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self.changed.wait()
+
+
+async def replay(value):
+    yield value
+
+
+class ResponseCache():
+    '''
+    LRU + TTL cache of generated code keyed by a hash of (model, prompt, code), with
+    single-flight: concurrent misses for the same key share one upstream call, or one
+    upstream stream (see subscribe).
+    '''
+    def __init__(self, max_entries=GENERATE_CACHE_SIZE, ttl=GENERATE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.pending = {}             # key -> task computing the value
+        self.streams = {}             # key -> SharedStream producing the value
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.joined_streams = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def key(*parts):
+        digest = hashlib.sha256()
+        for part in parts:
+            data = part.encode('utf-8')
+            # Length prefix so ("ab", "c") and ("a", "bc") hash differently
+            digest.update(len(data).to_bytes(8, 'big'))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self.entries[key]
+            self.expirations += 1
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_compute(self, key, compute):
+        '''
+        Return the cached value for key, or await compute() (a coroutine function) to make it.
+        Failures are not cached, every waiter on that call sees the exception.
+        '''
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        task = self.pending.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(compute())
+            self.pending[key] = task
+            task.add_done_callback(lambda done: self.finish(key, done))
+
+        # shield so one client disconnecting doesn't cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+    def finish(self, key, task):
+        self.pending.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.put(key, task.result())
+
+    def subscribe(self, key, start):
+        '''
+        Streaming counterpart of get_or_compute: returns an async iterator over the value's text chunks
+
+        A cached value comes back as one chunk. A stream already in flight for key is joined (chunks
+        it has sent are replayed first). Otherwise start() (returning an async iterator of chunks) is
+        opened as a new SharedStream, and its joined chunks are cached once it completes.
+        '''
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return replay(value)
+
+        shared = self.streams.get(key)
+        if shared is not None:
+            self.joined_streams += 1
+        else:
+            self.misses += 1
+            shared = SharedStream(start())
+            self.streams[key] = shared
+            shared.task.add_done_callback(lambda done: self.finish_stream(key, shared))
+        return shared.subscribe()
+
+    def finish_stream(self, key, shared):
+        if self.streams.get(key) is shared:
+            del self.streams[key]
+        if shared.error is None:
+            self.put(key, "".join(shared.chunks))
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced + self.joined_streams
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "joined_streams": self.joined_streams,
+            "streams_in_flight": len(self.streams),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": (self.hits + self.coalesced + self.joined_streams) / lookups if lookups else 0.0,
+        }
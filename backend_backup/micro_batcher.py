@@ -0,0 +1,112 @@
+import asyncio
+import os
+import numpy as np
+
+# Off unless MICRO_BATCHING=1; a batch closes when it is full or its first request has waited MICRO_BATCH_WAIT_MS
+MICRO_BATCHING = os.getenv("MICRO_BATCHING", "0") == "1"
+MICRO_BATCH_SIZE = int(os.getenv("MICRO_BATCH_SIZE", "64"))
+MICRO_BATCH_WAIT_MS = float(os.getenv("MICRO_BATCH_WAIT_MS", "2"))
+
+
+class MicroBatcher():
+    '''
+    Coalesces feature rows submitted by concurrent requests into one forward pass
+
+    predict: Function mapping a (batch, num_features) array to one prediction per row
+    executor: Thread pool the forward pass runs on, so the event loop stays free
+    '''
+    def __init__(self, predict, executor=None, max_batch_size=MICRO_BATCH_SIZE, max_wait_ms=MICRO_BATCH_WAIT_MS):
+        self.predict = predict
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        # Created on first use so they belong to the running event loop
+        self.queue = None
+        self.worker = None
+
+        self.batches = 0
+        self.rows = 0
+        self.largest_batch = 0
+
+    async def submit(self, features, predict=None):
+        '''
+        Queue one feature row and wait for its prediction
+
+        predict: Model to run this row through instead of self.predict (e.g. the Sampler a request
+                 started on, so it finishes there after a model reload); rows of different models
+                 collected together go through separate forward passes
+        '''
+        if self.worker is None:
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.create_task(self.run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((features, future, predict or self.predict))
+        return await future
+
+    async def collect(self):
+        loop = asyncio.get_running_loop()
+        items = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(items) < self.max_batch_size:
+            # Take anything already waiting without paying for a timer
+            if not self.queue.empty():
+                items.append(self.queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return items
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = await self.collect()
+            # Requests that were cancelled while queued don't need a prediction
+            groups = {}
+            for features, future, predict in items:
+                if not future.done():
+                    groups.setdefault(predict, []).append((features, future))
+
+            for predict, group in groups.items():
+                await self.run_batch(loop, predict, group)
+
+    async def run_batch(self, loop, predict, items):
+        self.batches += 1
+        self.rows += len(items)
+        self.largest_batch = max(self.largest_batch, len(items))
+
+        try:
+            features = np.stack([features for features, _ in items])
+            results = await loop.run_in_executor(self.executor, predict, features)
+        except Exception as error:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        for (_, future), result in zip(items, results):
+            if not future.done():
+                future.set_result(float(result))
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+        }
+
+    async def close(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
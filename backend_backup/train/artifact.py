@@ -0,0 +1,101 @@
+import os
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+
+try:
+    import torch
+except ImportError:
+    # Serving through the numpy engine doesn't need torch (see numpy_engine.py)
+    torch = None
+
+# Bump this whenever the layout of the artifact dict changes
+# 2: 'architecture' (Predictor shape) and each scaler's 'count'
+ARTIFACT_VERSION = 2
+# Versions load_artifact still reads; version 1 files get the defaults for the keys added since
+# (neural_net.build_predictor's default shape, no scaler count)
+SUPPORTED_ARTIFACT_VERSIONS = (1, 2)
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+ARTIFACT_PATH = os.path.join(CURRENT_DIR, 'model_artifact.pt')
+# Same artifact with int8 dynamically quantized Linear layers (written by quantize.py)
+QUANTIZED_ARTIFACT_PATH = os.path.join(CURRENT_DIR, 'model_artifact_int8.pt')
+# Small Predictor distilled from ARTIFACT_PATH (written by training_loop.py --distill)
+STUDENT_ARTIFACT_PATH = os.path.join(CURRENT_DIR, 'model_artifact_student.pt')
+
+# div_category value used in the training data for each tracked element
+DIV_TABLE = {
+    'nav-main': 0,
+    'hero-text': 1,
+    'btn-cta': 2,
+    'description': 3,
+    'btn-cta-2': 4
+}
+
+# Columns each scaler is fitted on (and applied to) during training
+SCALER_COLUMNS = {
+    'scaler': ["x", "y"],
+    'color_scaler': ["backgroundColor_R", "backgroundColor_G", "backgroundColor_B"],
+    'size_scaler': ["left", "top", "width", "height"],
+}
+
+
+def scaler_stats(scaler, columns):
+    return {
+        'columns': list(columns),
+        'mean': [float(v) for v in scaler.mean_],
+        'var': [float(v) for v in scaler.var_],
+        # Rows the statistics cover, so online_trainer.py can keep updating them with partial_fit
+        'count': int(np.max(scaler.n_samples_seen_)),
+    }
+
+
+def scaler_from_stats(stats):
+    '''
+    Rebuild a fitted StandardScaler from the mean and variance stored in an artifact
+    '''
+    scaler = StandardScaler()
+    scaler.mean_ = np.array(stats['mean'], dtype=np.float64)
+    scaler.var_ = np.array(stats['var'], dtype=np.float64)
+    scaler.scale_ = np.sqrt(scaler.var_)
+    scaler.scale_[scaler.scale_ == 0] = 1.0
+    scaler.n_features_in_ = len(scaler.mean_)
+    # Artifacts written before 'count' was stored can't say how many rows they saw
+    if 'count' in stats:
+        scaler.n_samples_seen_ = np.int64(stats['count'])
+    return scaler
+
+
+def save_artifact(path, model, features, scalers, div_table=DIV_TABLE):
+    '''
+    Write everything serving needs into one file
+
+    features: Ordered list of model input columns (the training CSV minus 'hits')
+    scalers: Dict of scaler name -> fitted StandardScaler, using the columns in SCALER_COLUMNS
+    '''
+    artifact = {
+        'version': ARTIFACT_VERSION,
+        'state_dict': model.state_dict(),
+        'architecture': {'hidden_layers': model.hidden_layers, 'inner_layer_size': model.inner_layer_size},
+        'features': list(features),
+        'scalers': {name: scaler_stats(scaler, SCALER_COLUMNS[name]) for name, scaler in scalers.items()},
+        'div_table': dict(div_table),
+    }
+    write_artifact(path, artifact)
+
+
+def write_artifact(path, artifact):
+    # Write to a temp file first so a crash never leaves a half written artifact behind
+    tmp_path = path + '.tmp'
+    torch.save(artifact, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_artifact(path):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"CRITICAL ERROR: Could not find model artifact at {path}. Run training_loop.py to create it")
+
+    artifact = torch.load(path, map_location=torch.device('cpu'))
+    if artifact.get('version') not in SUPPORTED_ARTIFACT_VERSIONS:
+        raise ValueError(f"Model artifact version {artifact.get('version')} is not supported (expected one of {SUPPORTED_ARTIFACT_VERSIONS})")
+
+    return artifact
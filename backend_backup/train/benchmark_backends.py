@@ -0,0 +1,39 @@
+'''
+Latency report for each Sampler inference backend
+
+Run from backend_backup/ with: python -m train.benchmark_backends
+'''
+from train.model_sampler import Sampler
+from train.inference_backends import BACKENDS, time_runner
+
+BATCH_SIZES = [1, 64, 4096]
+WARMUP_RUNS = 5
+TIMED_RUNS = 100
+
+
+def main():
+    results = []
+    for backend in BACKENDS:
+        try:
+            sampler = Sampler(backend=backend)
+        except Exception as e:
+            print(f"Skipping {backend}: {e}")
+            continue
+        if sampler.backend != backend:
+            print(f"Skipping {backend}: fell back to {sampler.backend}")
+            continue
+
+        for batch_size in BATCH_SIZES:
+            # Fewer runs for the big batches so the report finishes quickly
+            runs = TIMED_RUNS if batch_size < 1024 else TIMED_RUNS // 5
+            p50, p99 = time_runner(sampler.predict, len(sampler.features), batch_size, runs, WARMUP_RUNS)
+            results.append((backend, batch_size, p50, p99))
+
+    print()
+    print(f"{'backend':<12} {'batch':>6} {'p50 ms':>10} {'p99 ms':>10}")
+    for backend, batch_size, p50, p99 in results:
+        print(f"{backend:<12} {batch_size:>6} {p50:>10.3f} {p99:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
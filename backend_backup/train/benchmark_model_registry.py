@@ -0,0 +1,69 @@
+'''
+Serving many sites from one process through ModelRegistry
+
+Copies one artifact into a temporary registry for REPOS repos, then replays requests whose
+repo ids follow a Zipf distribution (a few busy sites, a long tail of quiet ones) under a
+budget that only fits some of the models. Reports how many loads and evictions that costs,
+the resident size, and get() latency when the model is resident vs loaded on demand.
+
+Run from backend_backup/ with: python -m train.benchmark_model_registry
+'''
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from train.artifact import STUDENT_ARTIFACT_PATH, ARTIFACT_PATH
+from train.model_registry import ModelRegistry, REGISTRY_ARTIFACT
+from train.model_sampler import Sampler
+from train.prediction_cache import PredictionCache
+
+REPOS = 200
+REQUESTS = 5000
+RESIDENT_MODELS = 20
+ZIPF_A = 1.3
+
+
+def main():
+    source = STUDENT_ARTIFACT_PATH if os.path.exists(STUDENT_ARTIFACT_PATH) else ARTIFACT_PATH
+    default = Sampler()
+    root = tempfile.mkdtemp(prefix='darwin-registry-')
+    try:
+        for i in range(REPOS):
+            os.makedirs(os.path.join(root, f'site_{i}'))
+            shutil.copy(source, os.path.join(root, f'site_{i}', REGISTRY_ARTIFACT))
+
+        # Budget sized from one loaded model so the benchmark holds RESIDENT_MODELS of them
+        per_model = Sampler(artifact_path=source).memory_bytes()
+        registry = ModelRegistry(default, root=root, budget_bytes=per_model * RESIDENT_MODELS, make_cache=PredictionCache)
+
+        rng = np.random.default_rng(0)
+        repos = [f'Site/{(rank - 1) % REPOS}' for rank in rng.zipf(ZIPF_A, size=REQUESTS)]
+        div_id = next(iter(default.div_table))
+
+        hit_ms, load_ms = [], []
+        for repo_id in repos:
+            loads = registry.loads
+            start = time.perf_counter()
+            sampler = registry.get(repo_id)
+            elapsed = (time.perf_counter() - start) * 1000
+            (load_ms if registry.loads > loads else hit_ms).append(elapsed)
+            sampler.sample(100, 200, div_id, None)
+
+        stats = registry.stats()
+        if stats['resident_mb'] > stats['budget_mb'] + per_model / (1024 * 1024):
+            raise SystemExit("Registry went over its memory budget")
+        if registry.get('../etc') is not default or registry.get('unknown/repo') is not default:
+            raise SystemExit("Unknown or invalid repo ids should get the default model")
+
+        print(f"Model: {source} ({per_model / 1024:.0f} KB resident each)")
+        print(f"{REQUESTS} requests over {len(set(repos))} of {REPOS} sites, budget {RESIDENT_MODELS} models")
+        print(f"Loads: {stats['loads']}  evictions: {stats['evictions']}  resident: {stats['resident']} ({stats['resident_mb']} MB)")
+        print(f"Resident hit rate: {len(hit_ms) / REQUESTS:.1%}")
+        print(f"get() p50 resident: {np.median(hit_ms) * 1000:.1f} us   p50 loaded on demand: {np.median(load_ms):.1f} ms")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+'''
+Cost of one style edit through PageState against re-vectorizing the whole page
+
+Also replays random edits on a page and checks the incrementally updated rows match
+a page compiled from scratch after every edit.
+
+Run from backend_backup/ with: python -m train.benchmark_page_state
+'''
+import random
+import time
+import numpy as np
+from train.model_sampler import Sampler
+from train.page_state import PageState
+from train.style_parser import parse_darwin_styles, style_table
+from train.benchmark_style_parser import generate_page
+
+PAGE_SIZES = [10, 100, 1000, 10000]
+EDITS = 200
+# Edits the dashboard sends: sizes, colours, and values that change how a property is typed
+CHECK_PROPS = ['width', 'height', 'left', 'backgroundColor', 'color', 'fontWeight', 'borderRadius', 'fontSize', 'cursor']
+CHECK_VALUES = [None, 0, 12, 3.5, '24px', '2rem', 'bold', 'normal', 'pointer', '#123456', 'white', 'auto', 'heavy']
+
+
+def tracked_page(size, div_table):
+    '''
+    Generated page whose first elements use the model's div ids, so they can be predicted on
+    '''
+    page = generate_page(size)
+    for i, div_id in enumerate(list(div_table)[:size]):
+        page = page.replace(f'data-darwin-id="el-{i}"', f'data-darwin-id="{div_id}"', 1)
+    return page
+
+
+def check_equivalence(sampler, edits=2000, seed=0):
+    rng = random.Random(seed)
+    state = PageState(sampler.encoder, parse_darwin_styles(generate_page(50, seed=seed, unstyled_tail=0.2)))
+    for _ in range(edits):
+        state.update(rng.choice(state.ids), rng.choice(CHECK_PROPS), rng.choice(CHECK_VALUES))
+        fresh = sampler.encoder.compile_page(*style_table(state.records))
+        for div_id in state.ids:
+            if not np.array_equal(state.rows.rows[div_id], fresh.rows[div_id], equal_nan=True):
+                raise SystemExit(f"PageState row for {div_id} differs from a full re-encode")
+    return state.stats()
+
+
+def main():
+    sampler = Sampler()
+    stats = check_equivalence(sampler)
+    print(f"Incremental rows match a full re-encode after every edit: OK ({stats['updates']} edits, {stats['rebuilds']} column rebuilds)")
+    print()
+
+    print(f"{'elements':>9} {'full re-encode ms':>18} {'delta us':>10} {'delta + predict us':>19}")
+    rng = np.random.default_rng(0)
+    for size in PAGE_SIZES:
+        page = tracked_page(size, sampler.div_table)
+        repeats = 3 if size <= 1000 else 1
+
+        full = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            sampler.encoder.compile_page(*style_table(parse_darwin_styles(page)))
+            full.append(time.perf_counter() - start)
+
+        state = PageState(sampler.encoder, parse_darwin_styles(page))
+        # Only the first elements have model div ids; which row gets edited makes no difference to the cost
+        div_ids = [state.ids[i] for i in rng.integers(0, min(size, len(sampler.div_table)), size=EDITS)]
+        widths = rng.integers(20, 600, size=EDITS).tolist()
+
+        start = time.perf_counter()
+        for div_id, width in zip(div_ids, widths):
+            state.update(div_id, 'width', width)
+        delta = (time.perf_counter() - start) / EDITS
+
+        start = time.perf_counter()
+        for div_id, width in zip(div_ids, widths):
+            state.update(div_id, 'width', width)
+            sampler.predict(sampler.encoder.encode([(100, 200, div_id, None)], state.rows))
+        with_predict = (time.perf_counter() - start) / EDITS
+
+        print(f"{size:>9} {min(full) * 1000:>18.2f} {delta * 1e6:>10.1f} {with_predict * 1e6:>19.1f}")
+
+
+if __name__ == '__main__':
+    main()
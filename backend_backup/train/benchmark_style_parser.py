@@ -0,0 +1,241 @@
+'''
+Speed of style_parser against the old regex + pandas vectorize_css on generated pages
+
+Also checks both produce the same table on pages the old parser handles correctly
+(every tracked element has a style, no commas inside values).
+
+The second pair of timings is the same page with the last half of the tracked elements styled
+through className instead of an inline style. The old regex then scans from each of those ids
+to the end of the page looking for a style={{ }}, which is quadratic in the page size.
+
+Run from backend_backup/ with: python -m train.benchmark_style_parser
+'''
+import re
+import time
+import numpy as np
+import pandas as pd
+from PIL import ImageColor
+from pandas.api.types import is_numeric_dtype
+from train.style_parser import parse_darwin_styles, style_table
+from train.model_sampler import webpage
+
+PAGE_SIZES = [10, 100, 1000, 10000]
+COLORS = ['#000', '#ffffff', '#1bb556', 'white', 'black', 'red', '#ff00ff', 'transparent']
+TAGS = ['div', 'button', 'h1', 'nav', 'section']
+
+
+def generate_page(num_elements, seed=0, unstyled_tail=0.0):
+    '''
+    A JSX page shaped like the reference page, with num_elements tracked elements
+
+    unstyled_tail: Fraction of elements, at the end of the page, that have a className instead of an inline style
+    '''
+    rng = np.random.default_rng(seed)
+    elements = []
+    first_unstyled = int(num_elements * (1 - unstyled_tail))
+    for i in range(num_elements):
+        tag = TAGS[i % len(TAGS)]
+        if i >= first_unstyled:
+            elements.append(f'''        <{tag} data-darwin-id="el-{i}" className="card">
+            Element {i}
+        </{tag}>''')
+            continue
+        style = [
+            "position: 'absolute'",
+            f"left: {rng.integers(0, 1800)}",
+            f"top: {rng.integers(0, 1000)}",
+            f"width: {rng.integers(20, 600)}",
+            f"height: {rng.integers(20, 300)}",
+        ]
+        if rng.random() < 0.7:
+            style.append(f"backgroundColor: '{COLORS[rng.integers(len(COLORS))]}'")
+        if rng.random() < 0.5:
+            style.append(f"color: '{COLORS[rng.integers(len(COLORS))]}'")
+        if rng.random() < 0.5:
+            style.append(f"borderRadius: '{rng.integers(0, 24)}px'")
+        if rng.random() < 0.3:
+            style.append(f"fontSize: '{rng.integers(8, 40) / 10}rem'")
+        if rng.random() < 0.4:
+            style.append(f"fontWeight: '{['bold', 'normal', 'lighter'][rng.integers(3)]}'")
+        if rng.random() < 0.2:
+            style.append("cursor: 'pointer'")
+        elements.append(
+            f'''        <{tag}
+            data-darwin-id="el-{i}"
+            style={{{{ {', '.join(style)} }}}}
+        >
+            Element {i}
+        </{tag}>'''
+        )
+    body = "\n\n".join(elements)
+    return f'''
+    <div style={{{{ position: 'relative', width: '100vw', height: '100vh', overflow: 'hidden' }}}}>
+        <DarwinTracker repoId="benchmark" />
+{body}
+    </div>
+    '''
+
+
+def new_vectorize_css(page):
+    ids, columns = style_table(parse_darwin_styles(page))
+    return pd.DataFrame(columns, index=ids)
+
+
+def same_table(old, new):
+    if sorted(old.columns) != sorted(new.columns) or list(old.index) != list(new.index):
+        return False
+    old = old[sorted(old.columns)].to_numpy(dtype=np.float64)
+    new = new[sorted(new.columns)].to_numpy(dtype=np.float64)
+    return np.array_equal(old, new, equal_nan=True)
+
+
+def timed(fn, *args, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def legacy_vectorize_css(webpage):
+    '''
+    The regex + pandas vectorize_css Sampler used before style_parser, kept as the reference output
+    '''
+    def parse_darwin_styles(jsx_text):
+        # Pattern explanation:
+        # 1. Look for data-darwin-id="ID_NAME"
+        # 2. Look for style={{ STYLE_CONTENT }}
+        # We use a non-greedy dot .*? to stay within the braces
+        pattern = r'data-darwin-id="([^"]+)"[\s\S]*?style=\{\{([^}]+)\}\}'
+
+        matches = re.finditer(pattern, jsx_text)
+        results = {}
+
+        for match in matches:
+            darwin_id = match.group(1)
+            style_content = match.group(2).strip()
+
+            # Split properties by comma, but be careful of nested commas (like in padding)
+            # For simple inline styles, splitting by comma and colon works:
+            style_dict = {}
+            props = re.findall(r"(\w+):\s*['\"]?([^'\",]+)['\"]?", style_content)
+
+            for key, value in props:
+                # Clean up numeric values
+                try:
+                    if value.isdigit():
+                        style_dict[key] = int(value)
+                    else:
+                        style_dict[key] = value
+                except:
+                    style_dict[key] = value
+
+            results[darwin_id] = style_dict
+
+        return results
+
+    # Execute
+    parsed_styles = parse_darwin_styles(webpage)
+
+    # View results for one element
+    df = pd.DataFrame(parsed_styles).T
+
+    def fill_rgb(x):
+        if pd.isna(x) or x=='' or x is None:
+            return (-1,-1,-1)
+        try:
+            return ImageColor.getrgb(x)
+        except:
+            return (-1,-1,-1)
+
+    def is_measurement(col):
+        for i in col:
+            if 'px' in i or 'rem' in i:
+                return True
+        return False
+
+    def fill_measurement(col):
+        vals = []
+        measurement_type = ""
+        for i in col:
+            try:
+                if 'px' in i:
+                    measurement_type = 'px'
+                    vals.append(float(i.split('px')[0]))
+                elif 'rem' in i:
+                    measurement_type = 'rem'
+                    vals.append(float(i.split('rem')[0]))
+                else:
+                    vals.append(None)
+            except:
+                vals.append(None)
+        none_replacement = 16 if measurement_type == 'px' else 1
+        return [x if x is not None else none_replacement for x in vals]
+
+    # Convert colour columns into categories
+    for col in df.columns:
+        # 1. Try to force it to numeric (handles strings like "450")
+        converted_col = pd.to_numeric(df[col], errors='coerce')
+
+        if not converted_col.isna().all():
+            # It's actually numeric! Update the column.
+            df[col] = converted_col
+        elif is_measurement(df[col].dropna().tolist()):
+            df[col] = fill_measurement(df[col].tolist())
+        elif 'color' in col or 'Color' in col:
+            # It's a complex object (like your RGB color tuples)
+            df[col] = df[col].apply(lambda x: fill_rgb(x))
+        else:
+            # It's a true categorical string (like "solid" or "relative")
+            df[col] = df[col].astype('category')
+
+
+    categorical_cols = []
+    for col in df:
+    # Convert colour columns into categories
+        if 'color' in col or 'Color' in col:
+            df[col] = df[col].apply(lambda x: x if isinstance(x, tuple) else (-1,-1,-1)) # transparent
+            df[[col+'_R',col+'_G',col+'_B']] = pd.DataFrame(df[col].tolist(), index=df.index)
+            df = df.drop(columns=[col])
+        # detect non-numeric columns as categories
+        else:
+            # Leave the categorical columns alone so get_dummies can one-hot them
+            if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+            if not is_numeric_dtype(df[col]):
+                categorical_cols.append(col)
+
+    df=pd.get_dummies(df, columns=categorical_cols, dtype=int)
+    return df, list(df.index)
+
+
+def main():
+    for name, page in [('reference page', webpage), ('generated 200', generate_page(200, seed=1))]:
+        if not same_table(legacy_vectorize_css(page)[0], new_vectorize_css(page)):
+            raise SystemExit(f"style_parser output differs from the old vectorize_css on the {name}")
+    print("Parity with the old vectorize_css: OK")
+    print()
+
+    print(f"{'':>19} {'all inline styles':^44} {'half unstyled':^33}")
+    print(f"{'elements':>9} {'page KB':>9} {'old ms':>10} {'tokenize ms':>12} {'table ms':>10} {'speedup':>8} "
+          f"{'old ms':>10} {'new ms':>10} {'speedup':>8}")
+    for size in PAGE_SIZES:
+        page = generate_page(size)
+        repeats = 3 if size <= 1000 else 1
+        old_ms = timed(legacy_vectorize_css, page, repeats=repeats)
+        tokenize_ms = timed(parse_darwin_styles, page, repeats=repeats)
+        records = parse_darwin_styles(page)
+        table_ms = timed(style_table, records, repeats=repeats)
+        new_ms = tokenize_ms + table_ms
+
+        unstyled = generate_page(size, unstyled_tail=0.5)
+        unstyled_old_ms = timed(legacy_vectorize_css, unstyled, repeats=repeats)
+        unstyled_new_ms = timed(new_vectorize_css, unstyled, repeats=repeats)
+
+        print(f"{size:>9} {len(page) / 1024:>9.1f} {old_ms:>10.2f} {tokenize_ms:>12.2f} {table_ms:>10.2f} {old_ms / new_ms:>7.1f}x "
+              f"{unstyled_old_ms:>10.2f} {unstyled_new_ms:>10.2f} {unstyled_old_ms / unstyled_new_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import numpy as np
+
+
+class PageRows():
+    '''
+    Raw (unscaled) feature rows of every tracked element on one page, laid out in model column order
+
+    rows: div_id -> float64 array, NaN where the page doesn't set that column for the element
+    columns: Positions of the columns the page's style table has, the only ones predict_other can override
+    '''
+    def __init__(self, rows, columns):
+        self.rows = rows
+        self.columns = columns
+
+
+class FeatureEncoder():
+    '''
+    Turns placement requests into model input rows, compiled once from an artifact's column schema
+
+    Every scaler in the schema is folded into a single per-column scale and shift
+    (value * scale + shift, identity for unscaled columns), so encoding a whole batch is
+    one fused multiply-add over a (batch, num_features) matrix. training_loop.py encodes
+    the training set with the same object, so serving can't drift from training.
+
+    features: Ordered list of model input columns
+    scalers: Dict of scaler name -> {'columns', 'mean', 'var'} (artifact['scalers'])
+    div_table: div_id -> div_category
+    '''
+    def __init__(self, features, scalers, div_table):
+        self.features = list(features)
+        self.index = {col: i for i, col in enumerate(self.features)}
+        self.div_table = dict(div_table)
+        self.num_features = len(self.features)
+
+        self.scale = np.ones(self.num_features, dtype=np.float64)
+        self.shift = np.zeros(self.num_features, dtype=np.float64)
+        for stats in scalers.values():
+            columns = [self.index[col] for col in stats['columns']]
+            std = np.sqrt(np.asarray(stats['var'], dtype=np.float64))
+            # Same guard as StandardScaler for constant columns
+            std[std == 0] = 1.0
+            self.scale[columns] = 1.0 / std
+            self.shift[columns] = -np.asarray(stats['mean'], dtype=np.float64) / std
+
+        self.xy_index = [self.index['x'], self.index['y']]
+        self.div_index = self.index['div_category']
+
+    @classmethod
+    def from_artifact(cls, artifact):
+        return cls(artifact['features'], artifact['scalers'], artifact['div_table'])
+
+    def compile_page(self, ids, columns):
+        '''
+        ids, columns: Style table of a page, as returned by style_parser.style_table
+        '''
+        matrix = np.full((len(ids), self.num_features), np.nan, dtype=np.float64)
+        positions = set()
+        for name, values in columns.items():
+            position = self.index.get(name)
+            if position is not None:
+                matrix[:, position] = values
+                positions.add(position)
+        return PageRows(dict(zip(ids, matrix)), positions)
+
+    def encode(self, queries, page):
+        '''
+        queries: List of (x, y, div_id, predict_other) tuples; only int values in predict_other
+                 override the page (the same rule PredictionCache.key relies on)
+        page: PageRows from compile_page
+        Returns a contiguous (len(queries), num_features) float32 matrix
+        '''
+        raw = np.empty((len(queries), self.num_features), dtype=np.float64)
+        for i, (x, y, div_id, predict_other) in enumerate(queries):
+            row = raw[i]
+            row[:] = page.rows[div_id]
+            if predict_other:
+                for key, value in predict_other.items():
+                    column = self.index.get(key)
+                    if column in page.columns and type(value) is int:
+                        row[column] = value
+            row[self.xy_index[0]] = x
+            row[self.xy_index[1]] = y
+            row[self.div_index] = self.div_table[div_id]
+        return self.finish(raw)
+
+    def encode_frame(self, df):
+        '''
+        Encode a DataFrame that already has every model column (e.g. the training CSV)
+        '''
+        return self.finish(df[self.features].to_numpy(dtype=np.float64, copy=True))
+
+    def transform_columns(self, values, columns):
+        '''
+        Scale raw values of some columns, e.g. an (N, 2) array of points for xy_index
+        '''
+        return values * self.scale[columns] + self.shift[columns]
+
+    def finish(self, raw):
+        raw *= self.scale
+        raw += self.shift
+        # Columns the page doesn't set are encoded as -1, as in training
+        np.nan_to_num(raw, copy=False, nan=-1.0)
+        return np.ascontiguousarray(raw, dtype=np.float32)
@@ -0,0 +1,267 @@
+'''
+Training data as memory-mapped float32 arrays, streamed in shuffled shards
+
+convert() turns training CSVs (synthetic_data.csv, augmented_data.csv, grouped_df.csv, ...) or a
+column directory written by data/gen_synthetic_data.py --format npy into a store directory:
+
+    features.npy  (rows, num_features) float32, raw (unscaled) feature values
+    labels.npy    (rows,) float32 hits
+    meta.json     feature columns, row count and sources
+
+Nothing is loaded whole: conversion goes chunk by chunk, scalers are fitted with partial_fit
+over chunks, and training reads shards of consecutive rows, a few at a time, shuffling rows
+within them. Memory use depends on BUFFER_ROWS, not on the size of the dataset.
+
+Convert from backend_backup/train with: python feature_store.py OUT_DIR SOURCE [SOURCE ...]
+Then train on it with: python training_loop.py --store OUT_DIR
+'''
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+try:
+    from train.artifact import SCALER_COLUMNS
+except ImportError:
+    from artifact import SCALER_COLUMNS
+
+# Rows read from a source / written to the store at once while converting
+CONVERT_CHUNK_ROWS = 262144
+# Rows per shard, the unit the split and the shuffle work on; small stores get smaller shards
+# so they still split into at least MIN_SHARDS of them
+SHARD_ROWS = 65536
+MIN_SHARDS = 100
+# Rows (whole shards) held in memory and shuffled together while streaming
+BUFFER_ROWS = 524288
+LABEL = 'hits'
+
+
+def source_chunks(path, chunk_rows=CONVERT_CHUNK_ROWS):
+    '''
+    DataFrame chunks of a training CSV, or of a directory of <column>.npy files
+    '''
+    if os.path.isdir(path):
+        names = sorted(name[:-4] for name in os.listdir(path) if name.endswith('.npy'))
+        columns = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in names}
+        rows = len(next(iter(columns.values()))) if columns else 0
+        for start in range(0, rows, chunk_rows):
+            yield pd.DataFrame({name: np.asarray(column[start:start + chunk_rows]) for name, column in columns.items()})
+        return
+
+    for chunk in pd.read_csv(path, chunksize=chunk_rows):
+        # grouped_df.csv was saved with its index
+        yield chunk.drop(columns=[col for col in chunk.columns if col.startswith('Unnamed')])
+
+
+def count_rows(path):
+    if os.path.isdir(path):
+        names = [name for name in os.listdir(path) if name.endswith('.npy')]
+        return len(np.load(os.path.join(path, names[0]), mmap_mode='r')) if names else 0
+    return sum(len(chunk) for chunk in pd.read_csv(path, usecols=[0], chunksize=CONVERT_CHUNK_ROWS))
+
+
+def convert(out_dir, sources, columns=None, chunk_rows=CONVERT_CHUNK_ROWS):
+    '''
+    Write sources (CSV files or npy column directories with the training CSV's columns) into one store
+
+    columns: Feature column order, defaults to the first source's (minus 'hits')
+    Returns the number of rows written
+    '''
+    total = sum(count_rows(source) for source in sources)
+    os.makedirs(out_dir, exist_ok=True)
+
+    features = labels = None
+    offset = 0
+    for source in sources:
+        for chunk in source_chunks(source, chunk_rows):
+            if columns is None:
+                columns = [col for col in chunk.columns if col != LABEL]
+            missing = [col for col in columns + [LABEL] if col not in chunk.columns]
+            if missing:
+                raise ValueError(f"{source} is missing columns {missing}")
+            if features is None:
+                features = np.lib.format.open_memmap(os.path.join(out_dir, 'features.npy'), mode='w+', dtype=np.float32, shape=(total, len(columns)))
+                labels = np.lib.format.open_memmap(os.path.join(out_dir, 'labels.npy'), mode='w+', dtype=np.float32, shape=(total,))
+
+            end = offset + len(chunk)
+            features[offset:end] = chunk[columns].to_numpy(dtype=np.float32)
+            labels[offset:end] = chunk[LABEL].to_numpy(dtype=np.float32)
+            offset = end
+
+    if features is not None:
+        features.flush()
+        labels.flush()
+        del features, labels
+
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+        json.dump({'columns': columns, 'rows': offset, 'sources': [os.path.abspath(source) for source in sources]}, f, indent=2)
+    return offset
+
+
+class FeatureStore():
+    '''
+    Read side of a store directory written by convert()
+
+    Every read maps the arrays, copies the requested rows and unmaps them again, so pages of
+    earlier shards don't stay attached to the process.
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.columns = meta['columns']
+        self.rows = meta['rows']
+        self.features_path = os.path.join(path, 'features.npy')
+        self.labels_path = os.path.join(path, 'labels.npy')
+
+    def __len__(self):
+        return self.rows
+
+    def read(self, start, end):
+        '''
+        Returns (float32 features, float32 labels) of rows [start, end)
+        '''
+        features = np.load(self.features_path, mmap_mode='r')
+        labels = np.load(self.labels_path, mmap_mode='r')
+        chunk = np.array(features[start:end]), np.array(labels[start:end])
+        del features, labels
+        return chunk
+
+    def shards(self, shard_rows=SHARD_ROWS):
+        shard_rows = max(1, min(shard_rows, -(-self.rows // MIN_SHARDS)))
+        return [(start, min(start + shard_rows, self.rows)) for start in range(0, self.rows, shard_rows)]
+
+    def split(self, test_size=0.2, val_fraction=0.125, seed=42):
+        '''
+        Shuffle the shards once (by seed) and deal them out to train / validation / test
+        val_fraction is a share of what's left after the test split, as in training_loop.load_splits
+        Returns (train shards, validation shards, test shards)
+        '''
+        shards = self.shards()
+        order = np.random.default_rng(seed).permutation(len(shards))
+        num_test = max(1, round(len(shards) * test_size))
+        num_val = max(1, round((len(shards) - num_test) * val_fraction))
+        pick = lambda indices: sorted(shards[i] for i in indices)
+        return pick(order[num_test + num_val:]), pick(order[num_test:num_test + num_val]), pick(order[:num_test])
+
+    def fit_scalers(self, shards, scaler_columns=SCALER_COLUMNS):
+        '''
+        StandardScalers over the given shards, fitted incrementally with partial_fit
+        '''
+        index = {col: i for i, col in enumerate(self.columns)}
+        scalers = {name: StandardScaler() for name in scaler_columns}
+        for start, end in shards:
+            features, _ = self.read(start, end)
+            for name, columns in scaler_columns.items():
+                scalers[name].partial_fit(features[:, [index[col] for col in columns]].astype(np.float64))
+        return scalers
+
+    def sample(self, shards, max_rows, seed=0):
+        '''
+        Up to max_rows rows drawn evenly from shards, e.g. a validation set small enough to keep in memory
+        '''
+        total = sum(end - start for start, end in shards)
+        keep = min(1.0, max_rows / max(total, 1))
+        rng = np.random.default_rng(seed)
+        features, labels = [], []
+        for start, end in shards:
+            shard_features, shard_labels = self.read(start, end)
+            rows = rng.random(len(shard_labels)) < keep
+            features.append(shard_features[rows])
+            labels.append(shard_labels[rows])
+        return np.concatenate(features), np.concatenate(labels)
+
+
+class ShardStream():
+    '''
+    One split of a FeatureStore as a stream of shuffled, encoded (X, y) tensor batches
+
+    Each epoch visits the shards in a new random order, loads about buffer_rows rows of them at a
+    time and shuffles those rows together (a smaller split is shuffled whole). Rows left over from
+    one buffer carry into the next, so an epoch yields ceil(len / batch_size) batches like the
+    in-memory path. Shuffling uses torch's RNG, which training_loop's checkpoints save and restore.
+
+    encoder: FeatureEncoder scaling raw rows into model inputs
+    '''
+    def __init__(self, store, shards, encoder, buffer_rows=BUFFER_ROWS):
+        self.store = store
+        self.shards = shards
+        self.encoder = encoder
+        self.buffer_rows = buffer_rows
+        self.rows = sum(end - start for start, end in shards)
+
+    def __len__(self):
+        return self.rows
+
+    def encode(self, features, labels):
+        X = self.encoder.finish(features.astype(np.float64))
+        return torch.from_numpy(X), torch.from_numpy(labels).view(-1, 1)
+
+    def buffers(self):
+        '''
+        Groups of shards, in a new random order, of about buffer_rows rows each
+        '''
+        group, rows = [], 0
+        for j in torch.randperm(len(self.shards)).tolist():
+            start, end = self.shards[j]
+            group.append((start, end))
+            rows += end - start
+            if rows >= self.buffer_rows:
+                yield group
+                group, rows = [], 0
+        if group:
+            yield group
+
+    def batches(self, batch_size):
+        carry_features = np.empty((0, len(self.store.columns)), dtype=np.float32)
+        carry_labels = np.empty(0, dtype=np.float32)
+
+        for group in self.buffers():
+            chunks = [self.store.read(start, end) for start, end in group]
+            features = np.concatenate([carry_features] + [chunk[0] for chunk in chunks])
+            labels = np.concatenate([carry_labels] + [chunk[1] for chunk in chunks])
+            permutation = torch.randperm(len(labels)).numpy()
+
+            full = len(labels) - len(labels) % batch_size
+            for start in range(0, full, batch_size):
+                rows = permutation[start:start + batch_size]
+                yield self.encode(features[rows], labels[rows])
+            carry_features, carry_labels = features[permutation[full:]], labels[permutation[full:]]
+
+        if len(carry_labels):
+            yield self.encode(carry_features, carry_labels)
+
+    def mae(self, model, batch_size=8192):
+        '''
+        Mean absolute error over every row of the split, in order, without holding it in memory
+        '''
+        model.eval()
+        total, rows = 0.0, 0
+        with torch.no_grad():
+            for start, end in self.shards:
+                for chunk_start in range(start, end, batch_size):
+                    X, y = self.encode(*self.store.read(chunk_start, min(chunk_start + batch_size, end)))
+                    total += (model(X) - y).abs().sum().item()
+                    rows += len(y)
+        return total / max(rows, 1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert training CSVs (or npy column directories) into a memory-mapped feature store")
+    parser.add_argument('out_dir')
+    parser.add_argument('sources', nargs='+')
+    parser.add_argument('--chunk-rows', type=int, default=CONVERT_CHUNK_ROWS)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    rows = convert(args.out_dir, args.sources, chunk_rows=args.chunk_rows)
+    print(f"{rows} rows from {len(args.sources)} sources written to {args.out_dir}")
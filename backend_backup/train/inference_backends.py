@@ -0,0 +1,133 @@
+import io
+import time
+import numpy as np
+
+try:
+    import torch
+    import torch.nn as nn
+except ImportError:
+    # Only the numpy runner works without torch
+    torch = None
+
+# Inference engines Sampler can serve through
+# torch: eager nn.Module, numpy: numpy_engine.NumpyPredictor, quantized: int8 dynamic Linear layers
+# (see quantize.py), the rest are compiled once at load time
+BACKENDS = ['torch', 'torchscript', 'compile', 'onnx', 'numpy', 'quantized']
+
+
+class EagerRunner():
+    '''
+    Runs a torch module on float32 numpy batches and returns a flat numpy array
+    '''
+    def __init__(self, model):
+        self.model = model.eval()
+
+    def __call__(self, features):
+        with torch.inference_mode():
+            return self.model(torch.from_numpy(features)).view(-1).numpy()
+
+
+class TorchScriptRunner(EagerRunner):
+    def __init__(self, model, num_features):
+        example = torch.zeros(1, num_features, dtype=torch.float32)
+        with torch.no_grad():
+            traced = torch.jit.trace(model.eval(), example)
+        # Freezing inlines the weights as constants so the graph can be optimized for inference
+        self.model = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+
+class CompileRunner(EagerRunner):
+    def __init__(self, model, num_features):
+        # dynamic=True so batch 1 and batch 4096 share one compiled graph
+        self.model = torch.compile(model.eval(), dynamic=True)
+        # Compile now rather than on the first request
+        self(np.zeros((2, num_features), dtype=np.float32))
+
+
+class OnnxRunner():
+    def __init__(self, model, num_features):
+        import onnxruntime
+
+        example = torch.zeros(1, num_features, dtype=torch.float32)
+        buffer = io.BytesIO()
+        torch.onnx.export(model.eval(), (example,), buffer, input_names=['features'], output_names=['hits'],
+                          dynamic_axes={'features': {0: 'batch'}, 'hits': {0: 'batch'}}, dynamo=False)
+
+        self.session = onnxruntime.InferenceSession(buffer.getvalue(), providers=['CPUExecutionProvider'])
+
+    def __call__(self, features):
+        return self.session.run(None, {'features': features})[0].reshape(-1)
+
+
+class NumpyRunner():
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, features):
+        return self.model(features).reshape(-1)
+
+
+def quantize_model(model):
+    '''
+    Swap every nn.Linear for an int8 dynamically quantized one: weights are stored as int8,
+    activations are quantized on the fly per batch. Returns a new module.
+    '''
+    return torch.ao.quantization.quantize_dynamic(model.eval(), {nn.Linear}, dtype=torch.qint8)
+
+
+def time_runner(runner, num_features, batch_size, runs=50, warmup=5):
+    '''
+    Time runner (anything taking a (batch, num_features) float32 array, e.g. Sampler.predict) on a random batch
+    Returns the (p50, p99) latency of one call, in milliseconds
+    '''
+    features = np.random.default_rng(0).normal(size=(batch_size, num_features)).astype(np.float32)
+    for _ in range(warmup):
+        runner(features)
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        runner(features)
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+
+def configure_threads(intra_op_threads, inter_op_threads=1):
+    '''
+    Pin torch's CPU thread pools. Each inference worker thread runs its own forward pass,
+    so intra_op_threads * workers should not exceed the number of cores.
+    '''
+    if torch is None:
+        return
+    torch.set_num_threads(intra_op_threads)
+    try:
+        torch.set_num_interop_threads(inter_op_threads)
+    except RuntimeError:
+        # Can only be set once, before any inter-op work has started
+        pass
+
+
+COMPILED_RUNNERS = {
+    'torchscript': TorchScriptRunner,
+    'compile': CompileRunner,
+    'onnx': OnnxRunner,
+}
+
+
+def build_runner(backend, model, num_features):
+    '''
+    Wrap a loaded model in the runner for the given backend
+    Falls back to eager torch if the backend can't be built on this machine
+
+    Returns (runner, name of the backend actually in use)
+    '''
+    if backend == 'numpy':
+        return NumpyRunner(model), backend
+    if backend in ('torch', 'quantized'):
+        return EagerRunner(model), backend
+
+    try:
+        return COMPILED_RUNNERS[backend](model, num_features), backend
+    except Exception as e:
+        print(f"WARNING: Could not build the '{backend}' backend, falling back to eager torch: {e}")
+        return EagerRunner(model), 'torch'
@@ -0,0 +1,175 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    from train.artifact import CURRENT_DIR
+    from train.model_sampler import Sampler
+except ImportError:
+    from artifact import CURRENT_DIR
+    from model_sampler import Sampler
+
+# Per-repo models live in MODEL_REGISTRY_DIR/<repo id>/model_artifact.pt, with an optional page.jsx
+# holding the reference page they predict against. Folders are named like the Firebase swarm paths:
+# "Owner/Name" is stored under owner_name
+MODEL_REGISTRY_DIR = os.path.join(CURRENT_DIR, 'models')
+REGISTRY_ARTIFACT = 'model_artifact.pt'
+REGISTRY_PAGE = 'page.jsx'
+# Total resident size of the loaded per-repo Samplers before the least recently used ones are dropped
+MODEL_MEMORY_BUDGET_MB = 512
+# Repos found without a model of their own that are remembered (least recently asked dropped first),
+# so requests for them skip the disk check
+MISSING_REPO_LIMIT = 4096
+
+REPO_ID = re.compile(r'[A-Za-z0-9_.-]+')
+
+
+def repo_folder(repo_id):
+    '''
+    Folder name of a repo id, or None for ids that can't name a registry folder
+    '''
+    folder = repo_id.replace('/', '_').lower()
+    if not REPO_ID.fullmatch(folder) or folder in ('.', '..'):
+        return None
+    return folder
+
+
+class ModelRegistry():
+    '''
+    Per-repo Samplers loaded on first use and kept under a memory budget
+
+    get(repo_id) returns the repo's Sampler, loading its artifact the first time it is asked for.
+    Loaded Samplers are kept in LRU order; once their memory_bytes() add up to more than the budget
+    the least recently used ones are dropped, so a process can serve many sites while only the hot
+    ones are resident. Repos without a model of their own (and requests without a repo id) get the
+    default Sampler, which is never evicted. That answer is cached per repo until forget_missing(),
+    which api.py calls from its model watcher so a newly added repo model is picked up.
+
+    default: Sampler used for unknown repos
+    root: Registry folder, see MODEL_REGISTRY_DIR
+    budget_bytes: Memory budget of the per-repo Samplers
+    backend: Inference backend of the per-repo Samplers
+    make_cache: Optional callable returning a fresh PredictionCache for each loaded Sampler
+    '''
+    def __init__(self, default, root=MODEL_REGISTRY_DIR, budget_bytes=MODEL_MEMORY_BUDGET_MB * 1024 * 1024,
+                 backend='torch', make_cache=None):
+        self.default = default
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.backend = backend
+        self.make_cache = make_cache
+
+        self.samplers = OrderedDict()  # folder -> Sampler
+        self.missing = OrderedDict()   # folder -> None, repos served by the default Sampler
+        self.resident_bytes = 0
+        self.lock = threading.Lock()
+        # One lock per folder being loaded, so concurrent first requests for a repo load it once
+        self.loading = {}
+
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.fallbacks = 0
+        self.missing_hits = 0
+        self.load_seconds = 0.0
+
+    def artifact_path(self, folder):
+        return os.path.join(self.root, folder, REGISTRY_ARTIFACT)
+
+    def get(self, repo_id):
+        '''
+        Sampler serving repo_id (the default Sampler for None or repos without a model)
+        '''
+        folder = repo_folder(repo_id) if repo_id else None
+        if folder is None:
+            return self.default
+
+        with self.lock:
+            sampler = self.samplers.get(folder)
+            if sampler is not None:
+                self.samplers.move_to_end(folder)
+                self.hits += 1
+                return sampler
+            if folder in self.missing:
+                self.missing.move_to_end(folder)
+                self.missing_hits += 1
+                return self.default
+            load_lock = self.loading.setdefault(folder, threading.Lock())
+
+        with load_lock:
+            # Another request may have loaded it while this one waited
+            with self.lock:
+                sampler = self.samplers.get(folder)
+                if sampler is not None:
+                    self.samplers.move_to_end(folder)
+                    self.hits += 1
+                    return sampler
+
+            if not os.path.exists(self.artifact_path(folder)):
+                with self.lock:
+                    self.fallbacks += 1
+                    self.loading.pop(folder, None)
+                    self.missing[folder] = None
+                    while len(self.missing) > MISSING_REPO_LIMIT:
+                        self.missing.popitem(last=False)
+                return self.default
+
+            start = time.perf_counter()
+            sampler = self.load(folder)
+            elapsed = time.perf_counter() - start
+
+            with self.lock:
+                self.samplers[folder] = sampler
+                self.resident_bytes += sampler.memory_bytes()
+                self.loads += 1
+                self.load_seconds += elapsed
+                self.evict(keep=folder)
+                self.loading.pop(folder, None)
+            print(f"Loaded model for {repo_id} in {elapsed * 1000:.0f} ms")
+            return sampler
+
+    def forget_missing(self):
+        '''
+        Check the disk again for every repo that had no model of its own
+        '''
+        with self.lock:
+            self.missing.clear()
+
+    def load(self, folder):
+        page = None
+        page_path = os.path.join(self.root, folder, REGISTRY_PAGE)
+        if os.path.exists(page_path):
+            with open(page_path) as f:
+                page = f.read()
+        cache = self.make_cache() if self.make_cache is not None else None
+        return Sampler(artifact_path=self.artifact_path(folder), backend=self.backend, cache=cache, page=page)
+
+    def evict(self, keep):
+        '''
+        Drop least recently used Samplers until under budget; keep (the one just loaded) always stays
+        Call with self.lock held
+        '''
+        while self.resident_bytes > self.budget_bytes and len(self.samplers) > 1:
+            folder = next(iter(self.samplers))
+            if folder == keep:
+                break
+            sampler = self.samplers.pop(folder)
+            self.resident_bytes -= sampler.memory_bytes()
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "resident": len(self.samplers),
+                "resident_mb": round(self.resident_bytes / (1024 * 1024), 2),
+                "budget_mb": round(self.budget_bytes / (1024 * 1024), 2),
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "fallbacks": self.fallbacks,
+                "missing_cached": len(self.missing),
+                "missing_hits": self.missing_hits,
+                "mean_load_ms": round(self.load_seconds / self.loads * 1000, 1) if self.loads else 0.0,
+            }
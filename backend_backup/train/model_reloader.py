@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+
+# Seconds between checks of the served artifact for a newer file (0 turns the watcher off)
+MODEL_RELOAD_INTERVAL = 5
+
+
+class ModelReloader():
+    '''
+    Watches the artifact a Sampler was loaded from and builds a warmed replacement when it changes
+
+    The file is only stat()ed on each check; a reload loads the new Sampler and warms it without
+    touching the one serving traffic, so the caller can swap its reference in one assignment and
+    requests already running finish on the old model. training_loop.py, quantize.py and
+    --distill write artifacts with os.replace, so a check never sees a half-written file.
+
+    load: Callable returning a new (not yet warmed) Sampler for path
+    path: Artifact file to watch
+    '''
+    def __init__(self, load, path):
+        self.load = load
+        self.path = path
+        self.signature = self.stat()
+        self.lock = threading.Lock()
+
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_reload_at = None
+        self.last_reload_ms = None
+
+    def stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def changed(self):
+        signature = self.stat()
+        return signature is not None and signature != self.signature
+
+    def reload(self, force=False):
+        '''
+        Load and warm a Sampler from path if it changed since the last load (or always with force)
+        Returns the new Sampler, or None if there was nothing to reload. Errors from loading are raised;
+        the file isn't retried until it changes again.
+        '''
+        with self.lock:
+            signature = self.stat()
+            if signature is None or (signature == self.signature and not force):
+                return None
+            self.signature = signature
+
+            start = time.perf_counter()
+            try:
+                sampler = self.load()
+                sampler.warm()
+            except Exception as error:
+                self.failures += 1
+                self.last_error = str(error)
+                raise
+
+            self.reloads += 1
+            self.last_error = None
+            self.last_reload_at = time.time()
+            self.last_reload_ms = (time.perf_counter() - start) * 1000
+            return sampler
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_reload_at": self.last_reload_at,
+            "last_reload_ms": round(self.last_reload_ms, 1) if self.last_reload_ms is not None else None,
+        }
@@ -1,24 +1,24 @@
-from sklearn.preprocessing import StandardScaler
 import pandas as pd
-from train.neural_net import Predictor
-# from neural_net import Predictor
-import os
-import torch
+from train.artifact import ARTIFACT_PATH, QUANTIZED_ARTIFACT_PATH, load_artifact
+from train.feature_encoder import FeatureEncoder
+from train.style_parser import parse_darwin_styles, style_table
+from train.page_state import PageState, PageStates
+from train.numpy_engine import NPZ_PATH, load_npz
+from train.inference_backends import BACKENDS, build_runner, quantize_model
 import numpy as np
-from PIL import ImageColor
-from pandas.api.types import is_numeric_dtype
-import re
+import hashlib
 
-# --- PATH CONFIGURATION (THE FIX) ---
-# Get the directory where THIS file (model_sampler.py) is located
-CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
-# Get the parent directory (backend_backup)
-BACKEND_ROOT = os.path.dirname(CURRENT_DIR)
+try:
+    import torch
+    from train.neural_net import build_predictor
+except ImportError:
+    # Without torch only the numpy backend is available
+    torch = None
 
-# Construct absolute paths
-CSV_PATH = os.path.join(BACKEND_ROOT, 'data', 'synthetic_data.csv')
-MODEL_PATH = os.path.join(CURRENT_DIR, 'train.pth')
-# -------------------------------------
+# Largest number of grid points pushed through the model at once by heatmap()
+HEATMAP_CHUNK_SIZE = 4096
+# Largest grid (columns * rows) heatmap() accepts
+MAX_HEATMAP_CELLS = 1_000_000
 
 webpage= """
     <div style={{ position: 'relative', width: '100vw', height: '100vh', overflow: 'hidden', backgroundColor: 'white' }}>
@@ -73,38 +73,136 @@ webpage= """
     """
 
 
+def heatmap_cells(width, height, step):
+    return -(-width // step) * -(-height // step)
+
+
 class Sampler():
-    def __init__(self):
-        self.scaler = StandardScaler()
-        self.color_scaler = StandardScaler()
-        self.size_scaler = StandardScaler()
-
-        print(f"DEBUG: Loading CSV from {CSV_PATH}")
-        
-        # FIX: Use Absolute Path
-        if os.path.exists(CSV_PATH):
-            df = pd.read_csv(CSV_PATH)
+    def __init__(self, artifact_path=None, backend='torch', cache=None, page=None):
+        '''
+        artifact_path: Model file to load, defaults to ARTIFACT_PATH (torch), NPZ_PATH (numpy)
+                       or QUANTIZED_ARTIFACT_PATH (quantized)
+        backend: 'torch' to run neural_net.Predictor eagerly, 'numpy' to run the torch-free numpy_engine,
+                 'quantized' to run the int8 Predictor written by quantize.py,
+                 or 'torchscript' / 'compile' / 'onnx' to compile the Predictor once at load time
+                 (falls back to 'torch' if compiling fails)
+        cache: Optional PredictionCache used by sample() and sample_batch(). It is emptied
+               whenever it gets bound to a Sampler with a different model file.
+        page: JSX source of the reference page predictions are made against, defaults to the demo page below
+        '''
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+        if backend != 'numpy' and torch is None:
+            raise ImportError("torch is not installed, use backend='numpy'")
+
+        # Weights, scaler statistics, feature order and div table all come from
+        # the artifact written by training_loop.py, so serving can't drift from training
+        if backend == 'numpy':
+            artifact_path = artifact_path or NPZ_PATH
+            print(f"DEBUG: Loading numpy weights from {artifact_path}")
+            artifact, self.model = load_npz(artifact_path)
         else:
-            raise FileNotFoundError(f"CRITICAL ERROR: Could not find synthetic_data.csv at {CSV_PATH}")
+            default_path = QUANTIZED_ARTIFACT_PATH if backend == 'quantized' else ARTIFACT_PATH
+            artifact_path = artifact_path or default_path
+            print(f"DEBUG: Loading model artifact from {artifact_path}")
+            artifact = load_artifact(artifact_path)
+
+        self.artifact_path = artifact_path
+        with open(artifact_path, 'rb') as f:
+            data = f.read()
+        self.model_version = hashlib.sha256(data).hexdigest()[:12]
+        self.artifact_bytes = len(data)
+
+        self.features = artifact['features']
+        self.div_table = artifact['div_table']
+        self.encoder = FeatureEncoder.from_artifact(artifact)
+        self.xy_index = self.encoder.xy_index
+
+        if backend != 'numpy':
+            self.model = build_predictor(artifact)
+            if artifact.get('quantization') == 'int8_dynamic':
+                # The quantized state_dict only fits a model with the same quantized layers
+                self.model = quantize_model(self.model)
+            elif backend == 'quantized':
+                raise ValueError(f"{artifact_path} is not a quantized artifact, run quantize.py to create one")
+            self.model.load_state_dict(artifact['state_dict'])
+            self.model.eval()
+
+        self.runner, self.backend = build_runner(backend, self.model, len(self.features))
+        print(f"Model loaded successfully ({self.backend} backend, version {self.model_version})")
+
+        self.cache = cache
+        if self.cache is not None:
+            self.cache.bind(self.model_version)
+
+        # The reference page never changes, so parse it once and keep the
+        # per-div raw feature rows around, keyed by the hash of the page source
+        self.reference_cache = {}
+        self.page_key = self.compile_reference(page or webpage)
+
+        # Editable copies of pages, see open_page()
+        self.pages = PageStates()
+
+    def compile_reference(self, page):
+        '''
+        Vectorize a page once and cache it as a page_state.PageState
+        Returns the cache key (a hash of the page source)
 
-        X = df[[col for col in df.columns if col != 'hits']].copy()
+        page: The html file, as a string
+        '''
+        page_key = hashlib.sha256(page.encode('utf-8')).hexdigest()
+        if page_key not in self.reference_cache:
+            self.reference_cache[page_key] = PageState(self.encoder, parse_darwin_styles(page))
+        return page_key
 
-        self.scaler.fit_transform(X[["x", "y"]].to_numpy())
-        self.color_scaler.fit(X[["backgroundColor_R", "backgroundColor_G", "backgroundColor_B"]].to_numpy())
-        self.size_scaler.fit(X[["left", "top", "width", "height"]].to_numpy())
+    def reference_rows(self, page_key=None):
+        return self.reference_cache[page_key or self.page_key].rows
 
-        self.model = Predictor(len([col for col in df.columns if col != 'hits']))
+    def memory_bytes(self):
+        '''
+        Rough resident size of this Sampler: the model weights (as stored in the artifact) plus the encoded reference page
+        '''
+        rows = self.reference_rows()
+        return self.artifact_bytes + sum(row.nbytes for row in rows.rows.values())
 
-        print(f"DEBUG: Loading Model from {MODEL_PATH}")
+    def warm(self, batch_sizes=(1, 64)):
+        '''
+        Run the model once per batch size so lazy setup (compiled graphs, allocator, quantized kernels)
+        happens before the Sampler takes traffic
+        '''
+        for batch_size in batch_sizes:
+            self.predict(np.zeros((batch_size, len(self.features)), dtype=np.float32))
+        div_id = next(iter(self.reference_rows().rows), None)
+        if div_id in self.div_table:
+            self.encoder.encode([(0, 0, div_id, None)], self.reference_rows())
 
-        # FIX: Use Absolute Path & CPU Mapping
-        if os.path.exists(MODEL_PATH):
-            # map_location='cpu' is crucial for Render (no GPU)
-            self.model.load_state_dict(torch.load(MODEL_PATH, map_location=torch.device('cpu')))
-            print("Model loaded successfully")
-        else:
-            print(f"WARNING: Model not found at {MODEL_PATH}")
+    def open_page(self, page=None):
+        '''
+        Start an editing session on a private copy of a page (the reference page by default)
+        Returns (page_id, darwin ids on the page)
+        '''
+        state = self.reference_cache[self.compile_reference(page) if page is not None else self.page_key].copy()
+        return self.pages.open(state), list(state.ids)
 
+    def update_page(self, page_id, div_id, prop, value, x, y):
+        '''
+        Apply one style edit to an open page and predict hits for the edited element at (x, y)
+        Only that element's row is re-encoded. Raises KeyError for unknown pages or elements,
+        and then leaves the page as it was.
+        '''
+        state = self.pages.get(page_id)
+        # An element on the page the model has no div category for would fail in encode, after the edit
+        if div_id not in self.div_table:
+            raise KeyError(div_id)
+        with state.lock:
+            old = state.records[div_id].get(prop) if div_id in state.records else None
+            state.update(div_id, prop, value)
+            try:
+                features = self.encoder.encode([(x, y, div_id, None)], state.rows)
+            except Exception:
+                state.update(div_id, prop, old)
+                raise
+        return max(0, float(self.predict(features)[0]))
     
     def vectorize_css(self, webpage):
         '''
@@ -113,149 +211,111 @@ class Sampler():
 
         webpage: The original html file, as a string
         '''
-        def parse_darwin_styles(jsx_text):
-            # Pattern explanation:
-            # 1. Look for data-darwin-id="ID_NAME"
-            # 2. Look for style={{ STYLE_CONTENT }}
-            # We use a non-greedy dot .*? to stay within the braces
-            pattern = r'data-darwin-id="([^"]+)"[\s\S]*?style=\{\{([^}]+)\}\}'
-            
-            matches = re.finditer(pattern, jsx_text)
-            results = {}
-
-            for match in matches:
-                darwin_id = match.group(1)
-                style_content = match.group(2).strip()
-                
-                # Split properties by comma, but be careful of nested commas (like in padding)
-                # For simple inline styles, splitting by comma and colon works:
-                style_dict = {}
-                props = re.findall(r"(\w+):\s*['\"]?([^'\",]+)['\"]?", style_content)
-                
-                for key, value in props:
-                    # Clean up numeric values
-                    try:
-                        if value.isdigit():
-                            style_dict[key] = int(value)
-                        else:
-                            style_dict[key] = value
-                    except:
-                        style_dict[key] = value
-                        
-                results[darwin_id] = style_dict
-
-            return results
-
-        # Execute
-        parsed_styles = parse_darwin_styles(webpage)
-
-        # View results for one element
-        df = pd.DataFrame(parsed_styles).T
-
-        def fill_rgb(x):
-            if pd.isna(x) or x=='' or x is None:
-                return (-1,-1,-1)
-            try:
-                return ImageColor.getrgb(x)
-            except:
-                return (-1,-1,-1)
-
-        def is_measurement(col):
-            for i in col:
-                if 'px' in i or 'rem' in i:
-                    return True
-            return False
-
-        def fill_measurement(col):
-            vals = []
-            measurement_type = ""
-            for i in col:
-                try:
-                    if 'px' in i:
-                        measurement_type = 'px'
-                        vals.append(float(i.split('px')[0]))
-                    elif 'rem' in i:
-                        measurement_type = 'rem'
-                        vals.append(float(i.split('rem')[0]))
-                    else:
-                        vals.append(None)
-                except:
-                    vals.append(None)
-            none_replacement = 16 if measurement_type == 'px' else 1
-            return [x if x is not None else none_replacement for x in vals]
-
-        # Convert colour columns into categories
-        for col in df.columns:
-            # 1. Try to force it to numeric (handles strings like "450")
-            converted_col = pd.to_numeric(df[col], errors='coerce')
-
-            if not converted_col.isna().all():
-                # It's actually numeric! Update the column.
-                df[col] = converted_col
-                # print(f"{col} is Numeric.")
-            elif is_measurement(df[col].dropna().tolist()):
-                df[col] = fill_measurement(df[col].tolist())
-                # print(f"{col} is a measurement")
-            elif 'color' in col or 'Color' in col:
-                # It's a complex object (like your RGB color tuples)
-                df[col] = df[col].apply(lambda x: fill_rgb(x))
-                # print(f"{col} is a Color/Complex object (Needs expansion).")
-            else:
-                # print(df[col].tolist())
-                # It's a true categorical string (like "solid" or "relative")
-                df[col] = df[col].astype('category')
-                # print(f"{col} is Categorical.")
-
-
-        categorical_cols = []
-        for col in df:
-        # Convert colour columns into categories
-            if 'color' in col or 'Color' in col:
-                df[col] = df[col].apply(lambda x: x if isinstance(x, tuple) else (-1,-1,-1)) # transparent
-                df[[col+'_R',col+'_G',col+'_B']] = pd.DataFrame(df[col].tolist(), index=df.index)
-                df = df.drop(columns=[col])
-            # detect non-numeric columns as categories
-            else:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-                if not is_numeric_dtype(df[col]):
-                    categorical_cols.append(col)
-
-        df=pd.get_dummies(df, columns=categorical_cols, dtype=int)
+        ids, columns = style_table(parse_darwin_styles(webpage))
+        df = pd.DataFrame(columns, index=ids)
         return df, list(df.index)
-    
+
+    def build_features(self, x, y, div_id, predict_other, reference_rows):
+        '''
+        Build the model input row for one element placed at (x, y)
+
+        reference_rows: The cached per-div feature rows for the reference page
+        '''
+        return self.encoder.encode([(x, y, div_id, predict_other)], reference_rows)[0]
+
+    def predict(self, features):
+        '''
+        Run the model on a (batch, num_features) array
+        Returns a flat float32 array with one prediction per row
+        '''
+        return self.runner(np.ascontiguousarray(features, dtype=np.float32))
+
     def sample(self, x, y, div_id, predict_other):
-        predict_ref = self.vectorize_css(webpage)[0]
-        self.model.eval()
-        transformed = self.scaler.transform(np.array([[x, y]]))
-
-        conversion_table = {
-            'nav-main': 0,
-            'hero-text': 1,
-            'btn-cta': 2,
-            'description': 3,
-            'btn-cta-2': 4
-        }
-
-        new_attributes = []
-        for row in predict_ref.loc[div_id].items():
-            if predict_other is not None and row[0] in predict_other.keys() and type(predict_other[row[0]]) is int:
-                new_attributes.append(predict_other[row[0]])
-            else:
-                new_attributes.append(row[1])
-        
-        bct = self.color_scaler.transform(np.array([[new_attributes[9], new_attributes[10], new_attributes[11]]]))
-        ct = self.color_scaler.transform(np.array([[new_attributes[12], new_attributes[13], new_attributes[14]]]))
-        st = self.size_scaler.transform(np.array([[new_attributes[0], new_attributes[1], new_attributes[2], new_attributes[3]]]))
-        final_list = [transformed[0, 0], transformed[0, 1], conversion_table[div_id], st[0, 0], st[0, 1], st[0, 2], st[0, 3]] 
-        final_list.extend(new_attributes[4:9])
-        final_list.extend([bct[0, 0], bct[0, 1], bct[0, 2], ct[0,0], ct[0, 1], ct[0, 2]])
-        final_list.extend(new_attributes[15:])
-
-        count = self.model(torch.tensor(np.nan_to_num(final_list, nan=-1.0), dtype=torch.float32))
+        if self.cache is not None:
+            key, x, y = self.cache.key(x, y, div_id, predict_other)
+            count = self.cache.get(key)
+            if count is not None:
+                return count
+
+        final_list = self.build_features(x, y, div_id, predict_other, self.reference_rows())
+        count = max(0, float(self.predict(final_list.reshape(1, -1))[0]))
         # print(f"[{x}, {y}, {div_id}]", count)
 
-        return max(0, count.item())
+        if self.cache is not None:
+            self.cache.put(key, count, self.model_version)
+        return count
 
+    def unknown_div_ids(self, div_ids):
+        '''
+        The div_ids (in order, without repeats) that aren't both in the div table and on the reference page
+        '''
+        rows = self.reference_rows().rows
+        return list(dict.fromkeys(div_id for div_id in div_ids if div_id not in self.div_table or div_id not in rows))
+
+    def sample_batch(self, queries):
+        '''
+        Score many placements with a single forward pass
+
+        queries: A list of (x, y, div_id, predict_other) tuples
+        Returns one predicted hit count per query, in the same order
+        '''
+        if len(queries) == 0:
+            return []
+
+        counts = [None] * len(queries)
+        keys = [None] * len(queries)
+        if self.cache is not None:
+            snapped = []
+            for i, (x, y, div_id, predict_other) in enumerate(queries):
+                keys[i], x, y = self.cache.key(x, y, div_id, predict_other)
+                counts[i] = self.cache.get(keys[i])
+                snapped.append((x, y, div_id, predict_other))
+            queries = snapped
+
+        # Only the queries the cache couldn't answer go through the model
+        missing = [i for i, count in enumerate(counts) if count is None]
+        if missing:
+            features = self.encoder.encode([queries[i] for i in missing], self.reference_rows())
+
+            for i, count in zip(missing, self.predict(features).tolist()):
+                counts[i] = max(0, count)
+                if self.cache is not None:
+                    self.cache.put(keys[i], counts[i], self.model_version)
+
+        return counts
+
+    def heatmap(self, div_id, predict_other=None, width=1920, height=1080, step=20, chunk_size=HEATMAP_CHUNK_SIZE):
+        '''
+        Predict hits for one element at every point of an x/y grid over the viewport
+        Returns an array of shape (rows, cols) where cell [i, j] is the element placed at (j * step, i * step)
+
+        width, height: Size of the viewport in pixels
+        step: Distance between grid points in pixels
+        chunk_size: Maximum number of grid points scored per forward pass
+        Raises ValueError for grids of more than MAX_HEATMAP_CELLS points or a div_id the model doesn't know
+        '''
+        if self.unknown_div_ids([div_id]):
+            raise ValueError(f"Unknown div_id: {div_id}")
+        cells = heatmap_cells(width, height, step)
+        if cells > MAX_HEATMAP_CELLS:
+            raise ValueError(f"A {width}x{height} grid with step {step} has {cells} cells, the limit is {MAX_HEATMAP_CELLS}")
+        # Only x and y change across the grid, so build the rest of the row once
+        base = self.build_features(0, 0, div_id, predict_other, self.reference_rows())
+
+        xs = np.arange(0, width, step, dtype=np.float64)
+        ys = np.arange(0, height, step, dtype=np.float64)
+        grid_x, grid_y = np.meshgrid(xs, ys)
+        points = np.column_stack([grid_x.ravel(), grid_y.ravel()])
+
+        # Feature rows are built per chunk, so memory is bounded by chunk_size rather than the grid
+        counts = np.empty(len(points), dtype=np.float32)
+        for start in range(0, len(points), chunk_size):
+            chunk = points[start:start + chunk_size]
+            features = np.tile(base, (len(chunk), 1))
+            features[:, self.xy_index] = self.encoder.transform_columns(chunk, self.xy_index)
+            counts[start:start + chunk_size] = self.predict(features)
+
+        return np.maximum(counts, 0).reshape(len(ys), len(xs))
 
 if __name__ == '__main__':
     s = Sampler()
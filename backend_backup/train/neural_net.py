@@ -11,25 +11,35 @@ HIDDEN_LAYERS = 16
 
 
 class Predictor(nn.Module):
-    def __init__(self, num_features):
+    def __init__(self, num_features, hidden_layers=HIDDEN_LAYERS, inner_layer_size=INNER_LAYER_SIZE):
         super().__init__()
+        self.hidden_layers = hidden_layers
+        self.inner_layer_size = inner_layer_size
 
         #self.div_embedding = nn.Embedding(NUM_DIVS, EMBEDDING_DIM)
 
         layers = []
 
         # Input layer
-        layers.append(nn.Linear(num_features, INNER_LAYER_SIZE))
+        layers.append(nn.Linear(num_features, inner_layer_size))
         layers.append(nn.ReLU())
 
-        for _ in range(HIDDEN_LAYERS):
-            layers.append(nn.Linear(INNER_LAYER_SIZE, INNER_LAYER_SIZE))
+        for _ in range(hidden_layers):
+            layers.append(nn.Linear(inner_layer_size, inner_layer_size))
             layers.append(nn.ReLU())
 
         # Output layer
-        layers.append(nn.Linear(INNER_LAYER_SIZE, 1))
+        layers.append(nn.Linear(inner_layer_size, 1))
 
         self.net = nn.Sequential(*layers)
 
     def forward(self, x):
-        return self.net(x)
\ No newline at end of file
+        return self.net(x)
+
+
+def build_predictor(artifact):
+    '''
+    Empty Predictor shaped like the one saved in a model artifact
+    Artifacts written before the shape was recorded use the default HIDDEN_LAYERS x INNER_LAYER_SIZE
+    '''
+    return Predictor(len(artifact['features']), **artifact.get('architecture', {}))
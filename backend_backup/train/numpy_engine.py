@@ -0,0 +1,128 @@
+import os
+import json
+import numpy as np
+
+try:
+    from train.artifact import CURRENT_DIR, ARTIFACT_PATH, SUPPORTED_ARTIFACT_VERSIONS, load_artifact
+except ImportError:
+    from artifact import CURRENT_DIR, ARTIFACT_PATH, SUPPORTED_ARTIFACT_VERSIONS, load_artifact
+
+NPZ_PATH = os.path.join(CURRENT_DIR, 'model_weights.npz')
+# Largest absolute difference from the torch Predictor export_npz accepts
+PARITY_TOLERANCE = 1e-3
+
+
+class NumpyPredictor():
+    '''
+    Runs the same Linear+ReLU stack as neural_net.Predictor using only numpy
+
+    weights, biases: One (out, in) weight and (out,) bias array per nn.Linear, in order
+    '''
+    def __init__(self, weights, biases):
+        # Store weights as contiguous (in, out) float32 so each layer is a single x @ W
+        self.weights = [np.ascontiguousarray(w.T, dtype=np.float32) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+
+    def __call__(self, x):
+        '''
+        x: (batch, num_features) or (num_features,) array
+        Returns an array of shape (batch, 1) (or (1,) for a single row)
+        '''
+        out = np.asarray(x, dtype=np.float32)
+        last = len(self.weights) - 1
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            out = out @ w
+            out += b
+            if i != last:
+                np.maximum(out, 0, out=out)
+        return out
+
+
+def linear_layers(state_dict):
+    '''
+    Return the (weight, bias) numpy pairs of a Predictor state_dict in forward order
+    '''
+    indices = sorted({int(key.split('.')[1]) for key in state_dict if key.endswith('.weight')})
+    weights = [state_dict[f'net.{i}.weight'].detach().cpu().numpy() for i in indices]
+    biases = [state_dict[f'net.{i}.bias'].detach().cpu().numpy() for i in indices]
+    return weights, biases
+
+
+def export_npz(artifact, path=NPZ_PATH, check=True):
+    '''
+    Write a model artifact (see artifact.py) to a .npz file the numpy engine can load without torch
+
+    check: Load the written file back and compare it with the torch Predictor (check_parity) before
+           it replaces path; raises ValueError past PARITY_TOLERANCE and leaves path untouched
+    Returns the largest difference from torch, or None when not checked
+    '''
+    weights, biases = linear_layers(artifact['state_dict'])
+
+    arrays = {}
+    for i, (w, b) in enumerate(zip(weights, biases)):
+        arrays[f'weight_{i}'] = w.astype(np.float32)
+        arrays[f'bias_{i}'] = b.astype(np.float32)
+
+    metadata = {key: value for key, value in artifact.items() if key != 'state_dict'}
+    arrays['metadata'] = np.array(json.dumps(metadata))
+
+    # np.savez appends .npz to names without it, so write through a file handle
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+
+    diff = None
+    if check:
+        diff = check_parity(artifact, load_npz(tmp_path)[1])
+        if diff > PARITY_TOLERANCE:
+            os.remove(tmp_path)
+            raise ValueError(f"Numpy engine differs from the torch model by {diff:.6f} (tolerance {PARITY_TOLERANCE}), {path} not written")
+    os.replace(tmp_path, path)
+    return diff
+
+
+def load_npz(path=NPZ_PATH):
+    '''
+    Returns (metadata, NumpyPredictor), where metadata has the same keys as a model artifact minus the state_dict
+    '''
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"CRITICAL ERROR: Could not find numpy weights at {path}. Run numpy_engine.py to export them")
+
+    with np.load(path, allow_pickle=False) as data:
+        metadata = json.loads(str(data['metadata']))
+        if metadata.get('version') not in SUPPORTED_ARTIFACT_VERSIONS:
+            raise ValueError(f"Model artifact version {metadata.get('version')} is not supported (expected one of {SUPPORTED_ARTIFACT_VERSIONS})")
+
+        num_layers = len([key for key in data.files if key.startswith('weight_')])
+        weights = [data[f'weight_{i}'] for i in range(num_layers)]
+        biases = [data[f'bias_{i}'] for i in range(num_layers)]
+
+    return metadata, NumpyPredictor(weights, biases)
+
+
+def check_parity(artifact, engine, num_rows=1024, seed=0):
+    '''
+    Compare the numpy engine against the torch Predictor on random inputs
+    Returns the largest absolute difference between the two outputs
+    '''
+    import torch
+    try:
+        from train.neural_net import build_predictor
+    except ImportError:
+        from neural_net import build_predictor
+
+    model = build_predictor(artifact)
+    model.load_state_dict(artifact['state_dict'])
+    model.eval()
+
+    x = np.random.default_rng(seed).normal(size=(num_rows, len(artifact['features']))).astype(np.float32)
+    with torch.no_grad():
+        expected = model(torch.from_numpy(x)).numpy()
+
+    return float(np.max(np.abs(engine(x) - expected)))
+
+
+if __name__ == '__main__':
+    diff = export_npz(load_artifact(ARTIFACT_PATH), NPZ_PATH)
+    print(f"Numpy weights written to {NPZ_PATH}")
+    print(f"Max abs difference vs torch: {diff:.6f}")
@@ -0,0 +1,177 @@
+'''
+Keep the served Predictor fresh from new labeled rows instead of retraining from scratch
+
+New rows (the training CSV schema: every feature column plus 'hits') arrive in mini-batches.
+Each batch updates the scalers' running mean/variance with partial_fit, then fine-tunes the
+current weights for a bounded number of steps on the new rows mixed with a replay buffer of
+earlier ones, so the model moves toward the new data without forgetting the old. publish()
+writes a normal artifact atomically; api.py's model watcher swaps it in within seconds.
+
+Run from backend_backup/train with: python online_trainer.py new_rows.csv [--chunk-size 256] [--steps 200]
+'''
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+import torch.optim as optim
+
+try:
+    from train.artifact import CURRENT_DIR, ARTIFACT_PATH, SCALER_COLUMNS, load_artifact, save_artifact, scaler_from_stats, scaler_stats
+    from train.feature_encoder import FeatureEncoder
+    from train.neural_net import build_predictor
+    from train.numpy_engine import NPZ_PATH, export_npz
+except ImportError:
+    from artifact import CURRENT_DIR, ARTIFACT_PATH, SCALER_COLUMNS, load_artifact, save_artifact, scaler_from_stats, scaler_stats
+    from feature_encoder import FeatureEncoder
+    from neural_net import build_predictor
+    from numpy_engine import NPZ_PATH, export_npz
+
+DATA_PATH = os.path.join(os.path.dirname(CURRENT_DIR), 'data', 'synthetic_data.csv')
+# Optimizer steps per mini-batch of new rows, rows per step, and a learning rate well below
+# training's so a handful of clicks nudges the model rather than overwriting it
+ONLINE_STEPS = 200
+ONLINE_BATCH_SIZE = 64
+ONLINE_LR = 0.0002
+# Rows kept for replay; each step draws half its batch from the newest rows and half from here
+REPLAY_SIZE = 5000
+# Scaler row count assumed for artifacts saved before scaler_stats stored one (the training split of synthetic_data.csv)
+ONLINE_PRIOR_COUNT = 400
+
+
+class OnlineTrainer():
+    '''
+    artifact_path: Artifact to start from
+    replay: Optional DataFrame of earlier labeled rows (e.g. the training CSV) to seed the replay buffer
+    '''
+    def __init__(self, artifact_path=ARTIFACT_PATH, replay=None, steps=ONLINE_STEPS, batch_size=ONLINE_BATCH_SIZE,
+                 lr=ONLINE_LR, seed=0):
+        artifact = load_artifact(artifact_path)
+        self.features = list(artifact['features'])
+        self.div_table = artifact['div_table']
+        self.steps = steps
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+        torch.manual_seed(seed)
+
+        self.scalers = {}
+        for name, stats in artifact['scalers'].items():
+            scaler = scaler_from_stats(stats)
+            if 'count' not in stats:
+                scaler.n_samples_seen_ = np.int64(ONLINE_PRIOR_COUNT)
+            self.scalers[name] = scaler
+        self.encoder = self.build_encoder()
+
+        self.model = build_predictor(artifact)
+        self.model.load_state_dict(artifact['state_dict'])
+        self.loss_fn = nn.MSELoss()
+        # Kept across updates so Adam's moment estimates carry over from batch to batch
+        self.optimizer = optim.AdamW(self.model.parameters(), lr=lr)
+
+        columns = self.features + ['hits']
+        self.replay = replay[columns].tail(REPLAY_SIZE).reset_index(drop=True) if replay is not None else pd.DataFrame(columns=columns)
+        self.updates = 0
+        self.rows_seen = 0
+
+    def build_encoder(self):
+        stats = {name: scaler_stats(scaler, SCALER_COLUMNS[name]) for name, scaler in self.scalers.items()}
+        return FeatureEncoder(self.features, stats, self.div_table)
+
+    def check(self, rows):
+        missing = [col for col in self.features + ['hits'] if col not in rows.columns]
+        if missing:
+            raise ValueError(f"New rows are missing columns {missing}")
+
+    def mae(self, X, y):
+        self.model.eval()
+        with torch.no_grad():
+            return (self.model(torch.from_numpy(X)) - torch.from_numpy(y).view(-1, 1)).abs().mean().item()
+
+    def update(self, rows):
+        '''
+        Fold one mini-batch of labeled rows into the scalers and fine-tune on it
+        Returns a dict with the MAE on these rows before and after, and the time it took
+        '''
+        self.check(rows)
+        rows = rows[self.features + ['hits']].reset_index(drop=True)
+        start = time.perf_counter()
+
+        for name, scaler in self.scalers.items():
+            scaler.partial_fit(rows[SCALER_COLUMNS[name]].to_numpy(dtype=np.float64))
+        # Scaling changed, so rows (old and new) are re-encoded with the updated statistics
+        self.encoder = self.build_encoder()
+        X_new = self.encoder.encode_frame(rows)
+        y_new = rows['hits'].to_numpy(dtype=np.float32)
+        before = self.mae(X_new, y_new)
+
+        X_replay = self.encoder.encode_frame(self.replay) if len(self.replay) else X_new
+        y_replay = self.replay['hits'].to_numpy(dtype=np.float32) if len(self.replay) else y_new
+        half = self.batch_size // 2
+
+        self.model.train()
+        for _ in range(self.steps):
+            new = self.rng.integers(0, len(X_new), size=self.batch_size - half)
+            old = self.rng.integers(0, len(X_replay), size=half)
+            batch_X = torch.from_numpy(np.concatenate([X_new[new], X_replay[old]]))
+            batch_y = torch.from_numpy(np.concatenate([y_new[new], y_replay[old]])).view(-1, 1)
+
+            loss = self.loss_fn(self.model(batch_X), batch_y)
+            self.optimizer.zero_grad(set_to_none=True)
+            loss.backward()
+            self.optimizer.step()
+
+        after = self.mae(X_new, y_new)
+        self.replay = pd.concat([self.replay, rows], ignore_index=True).tail(REPLAY_SIZE).reset_index(drop=True)
+        self.updates += 1
+        self.rows_seen += len(rows)
+        return {"rows": len(rows), "mae_before": before, "mae_after": after, "seconds": time.perf_counter() - start}
+
+    def publish(self, path=ARTIFACT_PATH, npz_path=None):
+        '''
+        Write the current weights and scalers as a regular artifact (and optionally numpy weights)
+        '''
+        self.model.eval()
+        save_artifact(path, self.model, self.features, self.scalers, self.div_table)
+        if npz_path is not None:
+            export_npz(load_artifact(path), npz_path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fine-tune the served Predictor on new labeled rows and publish it")
+    parser.add_argument('rows', help="CSV of new rows with the training CSV's columns")
+    parser.add_argument('--artifact', default=ARTIFACT_PATH, help="Artifact to start from")
+    parser.add_argument('--output', default=ARTIFACT_PATH, help="Where to publish the updated artifact")
+    parser.add_argument('--replay', default=DATA_PATH, help="Earlier rows to replay while fine-tuning ('' for none)")
+    parser.add_argument('--chunk-size', type=int, default=256, help="Rows per update")
+    parser.add_argument('--publish-every', type=int, default=1, help="Updates between published artifacts")
+    parser.add_argument('--steps', type=int, default=ONLINE_STEPS)
+    parser.add_argument('--lr', type=float, default=ONLINE_LR)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    torch.set_num_threads(1)
+    replay = pd.read_csv(args.replay) if args.replay else None
+    trainer = OnlineTrainer(args.artifact, replay=replay, steps=args.steps, lr=args.lr)
+    # The numpy engine serves the default artifact too, keep its weights in step
+    npz_path = NPZ_PATH if os.path.abspath(args.output) == ARTIFACT_PATH else None
+
+    start = time.perf_counter()
+    for chunk in pd.read_csv(args.rows, chunksize=args.chunk_size):
+        stats = trainer.update(chunk)
+        print(f"Update {trainer.updates}: {stats['rows']} rows, MAE on them {stats['mae_before']:.4f} -> {stats['mae_after']:.4f} "
+              f"({stats['seconds'] * 1000:.0f} ms)")
+        if trainer.updates % args.publish_every == 0:
+            trainer.publish(args.output, npz_path)
+
+    if trainer.updates % args.publish_every != 0:
+        trainer.publish(args.output, npz_path)
+    print(f"{trainer.rows_seen} rows in {trainer.updates} updates ({time.perf_counter() - start:.1f}s), "
+          f"artifact published to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
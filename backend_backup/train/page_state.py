@@ -0,0 +1,163 @@
+import threading
+import uuid
+from collections import OrderedDict
+
+try:
+    from train.style_parser import StyleColumn, style_properties, style_table, to_number
+except ImportError:
+    from style_parser import StyleColumn, style_properties, style_table, to_number
+
+# Editable pages kept per Sampler; the least recently used one is dropped past this
+PAGE_STATE_LIMIT = 256
+
+
+def typed_value(value):
+    '''
+    A style value sent by the editor as a style record value: numbers (or numeric strings) as numbers,
+    None / '' as "property not set", anything else as a string
+    '''
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        return str(value).lower()
+    number = to_number(value) if isinstance(value, (int, float, str)) else None
+    return number if number is not None else str(value)
+
+
+class PageState():
+    '''
+    Encoded feature rows of one page that can be edited one element property at a time
+
+    update() re-encodes only the edited element's columns for that property, so it costs the same
+    on a page of 5 elements as on one of 5,000. The only exception is an edit that changes how the
+    whole property is typed across the page (a new category value, the first number in a column
+    of strings, a px value turning into rem, ...); then that one property is rebuilt for every element,
+    exactly as style_table would lay it out.
+
+    encoder: FeatureEncoder the rows are laid out for
+    records: darwin_id -> {property: value}, as returned by style_parser.parse_darwin_styles
+    '''
+    def __init__(self, encoder, records):
+        self.encoder = encoder
+        self.records = {div_id: dict(style) for div_id, style in records.items()}
+        self.ids = list(self.records)
+        self.rows = encoder.compile_page(*style_table(self.records))
+        self.columns = {prop: StyleColumn(prop, self.values(prop)) for prop in style_properties(self.records)}
+        self.lock = threading.Lock()
+
+        self.updates = 0
+        self.rebuilds = 0
+
+    def values(self, prop):
+        return [self.records[div_id].get(prop) for div_id in self.ids]
+
+    def copy(self):
+        return PageState(self.encoder, self.records)
+
+    def update(self, div_id, prop, value):
+        '''
+        Set one style property of one element (value None removes it)
+        Raises KeyError for elements that aren't on the page
+        '''
+        style = self.records[div_id]
+        value = typed_value(value)
+        old = style.get(prop)
+        if value is None:
+            style.pop(prop, None)
+        else:
+            style[prop] = value
+        self.updates += 1
+
+        column = self.columns.get(prop)
+        if column is None or not column.replace(old, value):
+            self.rebuild(prop, column)
+            return
+
+        row = self.rows.rows[div_id]
+        for name, encoded in zip(column.names, column.cell(value)):
+            position = self.encoder.index.get(name)
+            if position is not None:
+                row[position] = encoded
+
+    def rebuild(self, prop, old_column):
+        '''
+        Re-type one property across the whole page and rewrite its columns for every element
+        '''
+        self.rebuilds += 1
+        values = self.values(prop)
+        column = StyleColumn(prop, values) if any(value is not None for value in values) else None
+        built = column.build(values) if column is not None else {}
+
+        # Columns the property no longer produces (e.g. a category nobody uses now) go back to "not on the page"
+        for name in old_column.names if old_column is not None else []:
+            position = self.encoder.index.get(name)
+            if name not in built and position is not None:
+                self.rows.columns.discard(position)
+                for row in self.rows.rows.values():
+                    row[position] = float('nan')
+
+        for name, encoded in built.items():
+            position = self.encoder.index.get(name)
+            if position is None:
+                continue
+            self.rows.columns.add(position)
+            for div_id, value in zip(self.ids, encoded):
+                self.rows.rows[div_id][position] = value
+
+        if column is None:
+            self.columns.pop(prop, None)
+        else:
+            self.columns[prop] = column
+
+    def stats(self):
+        return {"elements": len(self.ids), "updates": self.updates, "rebuilds": self.rebuilds}
+
+
+class PageStates():
+    '''
+    LRU of editable PageState copies keyed by a random page id, one per editing session
+    '''
+    def __init__(self, limit=PAGE_STATE_LIMIT):
+        self.limit = limit
+        self.pages = OrderedDict()
+        self.lock = threading.Lock()
+
+    def open(self, state):
+        page_id = uuid.uuid4().hex
+        with self.lock:
+            self.pages[page_id] = state
+            while len(self.pages) > self.limit:
+                self.pages.popitem(last=False)
+        return page_id
+
+    def carry_over(self, other, encoder, since=None):
+        '''
+        Take over the open pages of another PageStates (e.g. the previous model's after a reload),
+        re-encoded for encoder under the same page ids
+
+        since: Edit counts returned by an earlier carry_over from other; only pages edited (or opened) after it are copied
+        Returns page_id -> edit count of every page of other, as copied
+        '''
+        with other.lock:
+            states = list(other.pages.items())
+        versions = {}
+        for page_id, state in states:
+            with state.lock:
+                versions[page_id] = state.updates
+                if since is not None and since.get(page_id) == state.updates:
+                    continue
+                copy = PageState(encoder, state.records)
+            with self.lock:
+                self.pages[page_id] = copy
+                while len(self.pages) > self.limit:
+                    self.pages.popitem(last=False)
+        return versions
+
+    def get(self, page_id):
+        '''
+        Raises KeyError for unknown (or evicted) page ids
+        '''
+        with self.lock:
+            state = self.pages[page_id]
+            self.pages.move_to_end(page_id)
+            return state
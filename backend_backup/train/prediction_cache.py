@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Predictions kept per Sampler, the pixel grid x/y are snapped to, and an optional lifetime in seconds (0 = no TTL)
+PREDICTION_CACHE_SIZE = 10000
+PREDICTION_CACHE_GRID = 1
+PREDICTION_CACHE_TTL = 0
+
+
+class PredictionCache():
+    '''
+    Thread-safe LRU cache of Sampler predictions
+
+    Keys are (div_id, x, y, predict_other) with x/y snapped to a pixel grid, so the stream of
+    near-identical requests fired while dragging an element lands on the same entries.
+    The cache is tied to one model version and empties itself when that changes.
+    '''
+    def __init__(self, max_entries=PREDICTION_CACHE_SIZE, grid=PREDICTION_CACHE_GRID, ttl=PREDICTION_CACHE_TTL):
+        self.max_entries = max_entries
+        self.grid = grid
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+        self.model_version = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def snap(self, value):
+        if value is None:
+            return None
+        return round(value / self.grid) * self.grid
+
+    def key(self, x, y, div_id, predict_other):
+        '''
+        Returns (key, snapped x, snapped y)
+        Only int overrides change the features (see Sampler.build_features), so only those are part of the key
+        '''
+        overrides = ()
+        if predict_other is not None:
+            overrides = tuple(sorted((k, v) for k, v in predict_other.items() if type(v) is int))
+        x, y = self.snap(x), self.snap(y)
+        return (div_id, x, y, overrides), x, y
+
+    def bind(self, model_version):
+        '''
+        Attach the cache to a model version, dropping every entry made by a different one
+        '''
+        with self.lock:
+            if self.model_version != model_version:
+                if self.entries:
+                    self.invalidations += 1
+                self.entries.clear()
+                self.model_version = model_version
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, model_version=None):
+        '''
+        model_version: Version of the model that made the prediction; predictions of a model the cache
+                       is no longer bound to (e.g. finished just after a reload) are dropped
+        '''
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self.lock:
+            if model_version is not None and model_version != self.model_version:
+                return
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "model_version": self.model_version,
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "grid": self.grid,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
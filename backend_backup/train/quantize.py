@@ -0,0 +1,98 @@
+'''
+Convert the trained Predictor to int8 dynamic quantization and report what it costs
+
+Writes QUANTIZED_ARTIFACT_PATH (serve it with Sampler(backend='quantized') / SAMPLER_BACKEND=quantized)
+and prints MAE against the held-out split of synthetic_data.csv plus single-thread latency,
+for the float model and the int8 model side by side.
+
+Run from backend_backup/train with: python quantize.py
+'''
+import io
+import os
+import numpy as np
+import pandas as pd
+import torch
+from sklearn.model_selection import train_test_split
+
+try:
+    from train.artifact import CURRENT_DIR, ARTIFACT_PATH, QUANTIZED_ARTIFACT_PATH, load_artifact, write_artifact
+    from train.feature_encoder import FeatureEncoder
+    from train.inference_backends import EagerRunner, quantize_model, time_runner
+    from train.neural_net import build_predictor
+except ImportError:
+    from artifact import CURRENT_DIR, ARTIFACT_PATH, QUANTIZED_ARTIFACT_PATH, load_artifact, write_artifact
+    from feature_encoder import FeatureEncoder
+    from inference_backends import EagerRunner, quantize_model, time_runner
+    from neural_net import build_predictor
+
+DATA_PATH = os.path.join(os.path.dirname(CURRENT_DIR), 'data', 'synthetic_data.csv')
+BATCH_SIZES = [1, 64, 4096]
+TIMED_RUNS = 50
+# Largest MAE increase (in hits) tolerated before the int8 model is rejected
+MAX_MAE_INCREASE = 0.5
+
+
+def load_test_split(artifact, path=DATA_PATH):
+    '''
+    The same held-out 20% training_loop.py evaluates on, scaled with the artifact's scalers
+    Returns (features, labels) as float32 arrays
+    '''
+    df = pd.read_csv(path)
+    X = FeatureEncoder.from_artifact(artifact).encode_frame(df)
+
+    _, X_test, _, y_test = train_test_split(X, df['hits'].values, test_size=0.2, random_state=42)
+    return X_test, y_test.astype(np.float32)
+
+
+def serialized_size(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def main():
+    # Serving runs one torch thread per worker, measure under the same conditions
+    torch.set_num_threads(1)
+
+    artifact = load_artifact(ARTIFACT_PATH)
+    num_features = len(artifact['features'])
+
+    model = build_predictor(artifact)
+    model.load_state_dict(artifact['state_dict'])
+    model.eval()
+    quantized = quantize_model(model)
+
+    float_runner = EagerRunner(model)
+    int8_runner = EagerRunner(quantized)
+
+    X_test, y_test = load_test_split(artifact)
+    float_preds = float_runner(X_test)
+    int8_preds = int8_runner(X_test)
+
+    float_mae = float(np.mean(np.abs(float_preds - y_test)))
+    int8_mae = float(np.mean(np.abs(int8_preds - y_test)))
+    drift = float(np.mean(np.abs(int8_preds - float_preds)))
+
+    print(f"Held-out rows: {len(y_test)}")
+    print(f"{'':<16} {'float32':>10} {'int8':>10}")
+    print(f"{'MAE':<16} {float_mae:>10.4f} {int8_mae:>10.4f}")
+    print(f"{'size KB':<16} {serialized_size(model) / 1024:>10.1f} {serialized_size(quantized) / 1024:>10.1f}")
+    for batch_size in BATCH_SIZES:
+        runs = TIMED_RUNS if batch_size < 1024 else TIMED_RUNS // 5
+        float_ms, _ = time_runner(float_runner, num_features, batch_size, runs)
+        int8_ms, _ = time_runner(int8_runner, num_features, batch_size, runs)
+        print(f"{f'p50 ms @ {batch_size}':<16} {float_ms:>10.3f} {int8_ms:>10.3f}")
+    print(f"Mean abs difference int8 vs float32: {drift:.4f}")
+
+    if int8_mae - float_mae > MAX_MAE_INCREASE:
+        raise SystemExit(f"int8 model loses too much accuracy (MAE +{int8_mae - float_mae:.4f}), not writing it")
+
+    quantized_artifact = dict(artifact)
+    quantized_artifact['state_dict'] = quantized.state_dict()
+    quantized_artifact['quantization'] = 'int8_dynamic'
+    write_artifact(QUANTIZED_ARTIFACT_PATH, quantized_artifact)
+    print(f"Quantized artifact written to {QUANTIZED_ARTIFACT_PATH}")
+
+
+if __name__ == '__main__':
+    main()
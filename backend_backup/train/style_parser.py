@@ -0,0 +1,417 @@
+import math
+import re
+from functools import lru_cache
+from PIL import ImageColor
+
+# Stand-in for colours that are missing or can't be parsed (also what "transparent" ends up as)
+NO_COLOR = (-1, -1, -1)
+
+
+# Characters each scanner has to stop at; everything in between is skipped by the regex engine
+STRING_STOP = {quote: re.compile(r'[\\' + quote + ']' + (r'|\$\{' if quote == '`' else '')) for quote in '\'"`'}
+BRACE_STOP = re.compile(r"[{}'\"`]|/\*")
+SPLIT_STOP = re.compile(r"[()\[\]{}'\"`,:]")
+TAG_STOP = re.compile(r"[>{'\"]|[A-Za-z_][\w\-:.]*\s*=\s*")
+PAGE_STOP = re.compile(r"<[A-Za-z]|\{/\*")
+TAG_NAME = re.compile(r"[\w\-:.]*")
+# One `key: value,` entry whose value is a plain quoted string or a bare word/number; anything
+# else (template literals, calls like rgba(...), nested objects) goes through split_top_level
+SIMPLE_ENTRY = re.compile(r"""\s*(['"]?)([\w$-]+)\1\s*:\s*('[^'\\\n]*'|"[^"\\\n]*"|[^,'"`(){}\[\]]*?)\s*(?:,|(?=\}))""")
+CLOSE_BRACE = re.compile(r"\s*\}")
+OPEN_BRACE = re.compile(r"\s*\{")
+
+
+def skip_string(text, i):
+    '''
+    text[i] is a quote; returns the index just past the closing quote
+    '''
+    quote = text[i]
+    stop = STRING_STOP[quote]
+    i += 1
+    while True:
+        match = stop.search(text, i)
+        if match is None:
+            return len(text)
+        c = match.group()
+        if c == '\\':
+            i = match.end() + 1
+        elif c == '${':
+            i = skip_braces(text, match.start() + 1)
+        else:
+            return match.end()
+
+
+def skip_braces(text, i, depth=0):
+    '''
+    text[i] is '{'; returns the index just past its matching '}'
+    (with depth=1, i is already inside the braces and the next unmatched '}' closes them)
+    Strings, template literals (including ${...} inside them) and comments are skipped whole,
+    so braces inside them don't count
+    '''
+    while True:
+        match = BRACE_STOP.search(text, i)
+        if match is None:
+            return len(text)
+        c = match.group()
+        i = match.start()
+        if c == '{':
+            depth += 1
+            i += 1
+        elif c == '}':
+            depth -= 1
+            i += 1
+            if depth == 0:
+                return i
+        elif c == '/*':
+            end = text.find('*/', i + 2)
+            i = len(text) if end == -1 else end + 2
+        else:
+            i = skip_string(text, i)
+
+
+def split_top_level(text, separator):
+    '''
+    Split text on separator (',' or ':'), ignoring separators nested inside brackets, strings or template literals
+    '''
+    parts = []
+    depth = 0
+    start = 0
+    i = 0
+    while True:
+        match = SPLIT_STOP.search(text, i)
+        if match is None:
+            break
+        c = match.group()
+        i = match.start()
+        if c in '\'"`':
+            i = skip_string(text, i)
+            continue
+        if c in '([{':
+            depth += 1
+        elif c in ')]}':
+            depth -= 1
+        elif c == separator and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+        i += 1
+    parts.append(text[start:])
+    return parts
+
+
+NUMBER_START = set('+-.0123456789')
+
+
+def to_number(value):
+    '''
+    The number a style value stands for (what pd.to_numeric would make of it), or None
+    '''
+    if isinstance(value, (int, float)):
+        return value
+    return parse_number(value)
+
+
+@lru_cache(maxsize=4096)
+def parse_number(value):
+    text = value.strip()
+    # Most style values are words; don't pay for a float() exception on each of them
+    if not text or text[0] not in NUMBER_START or '_' in text:
+        return None
+    try:
+        number = float(text)
+    except ValueError:
+        return None
+    if math.isnan(number):
+        return None
+    return int(text) if text.isdigit() else number
+
+
+def style_value(raw):
+    '''
+    Typed value of one property in a JSX style object: the contents of a quoted string or
+    template literal, a number for numeric literals, otherwise the expression source as a string
+    '''
+    raw = raw.strip()
+    if len(raw) >= 2 and raw[0] in '\'"`' and raw[-1] == raw[0]:
+        text = raw[1:-1]
+    else:
+        text = raw
+    number = to_number(text)
+    return number if number is not None else text
+
+
+def parse_object_at(text, i):
+    '''
+    text[i] is the '{' of a style object literal, e.g. "{ left: 40, color: '#000' }"
+    Returns (dict of property -> typed value, index just past the closing '}')
+    Spread entries like ...base are skipped
+    '''
+    style = {}
+    i += 1
+    # Fast path: plain `key: 'value'` entries, one regex match each, straight from the page text
+    while True:
+        match = SIMPLE_ENTRY.match(text, i)
+        if match is None:
+            break
+        style[match.group(2)] = style_value(match.group(3))
+        i = match.end()
+
+    close = CLOSE_BRACE.match(text, i)
+    if close is not None:
+        return style, close.end()
+
+    # Something the fast path can't read (template literal, rgba(...), nested object): split the rest properly
+    end = skip_braces(text, i, depth=1)
+    for entry in split_top_level(text[i:end - 1], ','):
+        entry = entry.strip()
+        if not entry or entry.startswith('...'):
+            continue
+        parts = split_top_level(entry, ':')
+        if len(parts) < 2:
+            continue
+        key = parts[0].strip().strip('\'"')
+        style[key] = style_value(':'.join(parts[1:]))
+    return style, end
+
+
+def parse_tag(text, i, records):
+    '''
+    text[i] is the first character of a tag name; reads the tag's attributes and returns the index past its '>'
+    '''
+    i = TAG_NAME.match(text, i).end()
+
+    darwin_id = None
+    style = {}
+    while True:
+        match = TAG_STOP.search(text, i)
+        if match is None:
+            i = len(text)
+            break
+        c = match.group()
+        i = match.start()
+        if c == '>':
+            i += 1
+            break
+        if c == '{':
+            # {...props} spread
+            i = skip_braces(text, i)
+            continue
+        if c in '\'"':
+            # Stray quote outside an attribute value
+            i = skip_string(text, i)
+            continue
+
+        # name= followed by a "string" or an {expression}
+        name = c.split('=')[0].strip()
+        i = match.end()
+        if i >= len(text):
+            break
+        if name == 'style' and text[i] == '{':
+            # style={{ ... }}: read the object literal where it is rather than copying it out first
+            inner = OPEN_BRACE.match(text, i + 1)
+            if inner is not None:
+                style, end = parse_object_at(text, inner.end() - 1)
+                close = CLOSE_BRACE.match(text, end)
+                i = close.end() if close is not None else skip_braces(text, i)
+            else:
+                # style={styles.box} isn't an inline object, there is nothing to read
+                i = skip_braces(text, i)
+            continue
+        if text[i] in '\'"':
+            end = skip_string(text, i)
+            value, is_expression = text[i + 1:end - 1], False
+        elif text[i] == '{':
+            end = skip_braces(text, i)
+            value, is_expression = text[i + 1:end - 1], True
+        else:
+            continue
+        i = end
+
+        if name == 'data-darwin-id' and not is_expression:
+            darwin_id = value
+
+    if darwin_id is not None:
+        records[darwin_id] = style
+    return i
+
+
+def parse_darwin_styles(jsx_text):
+    '''
+    Single pass over a JSX page collecting the inline style of every element with a data-darwin-id
+    Returns a dict of darwin_id -> {property: value}, with numbers already converted
+
+    Attribute values are read by matching braces, skipping strings, template literals and comments,
+    so nested objects, commas inside rgba(...) and `${...}` expressions don't break the parse.
+    Scanning only stops at characters that matter, so the cost is linear in the page size.
+    '''
+    records = {}
+    i = 0
+    while True:
+        match = PAGE_STOP.search(jsx_text, i)
+        if match is None:
+            break
+        if match.group() == '{/*':
+            end = jsx_text.find('*/', match.end())
+            i = len(jsx_text) if end == -1 else end + 2
+        else:
+            i = parse_tag(jsx_text, match.start() + 1, records)
+    return records
+
+
+@lru_cache(maxsize=4096)
+def parse_color(value):
+    '''
+    (R, G, B) for a CSS colour string, NO_COLOR if it can't be parsed
+    '''
+    try:
+        return tuple(ImageColor.getrgb(value)[:3])
+    except (ValueError, AttributeError):
+        return NO_COLOR
+
+
+def is_color_column(name):
+    return 'color' in name or 'Color' in name
+
+
+def measurement_unit(value):
+    '''
+    'px' or 'rem' for measurement strings like '24px' / '3.5rem' (px wins if both appear), otherwise None
+    '''
+    if isinstance(value, str):
+        if 'px' in value:
+            return 'px'
+        if 'rem' in value:
+            return 'rem'
+    return None
+
+
+def measurement_value(value):
+    unit = measurement_unit(value)
+    return to_number(value.split(unit)[0]) if unit is not None else None
+
+
+class StyleColumn():
+    '''
+    How one style property is turned into model columns, decided from the values it takes across a page
+
+    kind is 'number', 'measurement' (px/rem strings), 'color' (split into <prop>_R/_G/_B)
+    or 'category' (one 0/1 column <prop>_<value> per distinct value). names are the resulting
+    column names. The counts behind that decision are kept so PageState can tell, after one
+    value changes, whether the column still has the same kind and names.
+    '''
+    def __init__(self, prop, values):
+        self.prop = prop
+        self.color = is_color_column(prop)
+        self.present = 0
+        self.numbers = 0
+        self.measurements = 0
+        self.counts = {}
+        for value in values:
+            self.add(value)
+        self.kind, self.names = self.layout()
+        # Measurements that can't be read become 16 if the last unit on the page is px, 1 otherwise
+        units = [unit for unit in map(measurement_unit, values) if unit is not None]
+        self.missing = 16.0 if units and units[-1] == 'px' else 1.0
+
+    def add(self, value, sign=1):
+        if value is None:
+            return
+        self.present += sign
+        if to_number(value) is not None:
+            self.numbers += sign
+        if measurement_unit(value) is not None:
+            self.measurements += sign
+        count = self.counts.get(value, 0) + sign
+        if count:
+            self.counts[value] = count
+        else:
+            del self.counts[value]
+
+    def layout(self):
+        if self.numbers:
+            kind = 'number'
+        elif self.measurements:
+            kind = 'measurement'
+        elif self.color:
+            kind = 'color'
+        else:
+            kind = 'category'
+
+        if self.color:
+            names = [self.prop + '_R', self.prop + '_G', self.prop + '_B']
+        elif kind == 'category':
+            self.categories = sorted(self.counts, key=str)
+            names = [f"{self.prop}_{category}" for category in self.categories]
+        else:
+            names = [self.prop]
+        return kind, names
+
+    def replace(self, old, new):
+        '''
+        Account for one element's value changing from old to new (None = property not set)
+        Returns False if that changes the column's kind, names or measurement fill value,
+        in which case the column has to be rebuilt for every element
+        '''
+        self.add(old, -1)
+        self.add(new)
+        if self.present == 0 or (self.kind, self.names) != self.layout():
+            return False
+        return self.kind != 'measurement' or measurement_unit(old) == measurement_unit(new)
+
+    def cell(self, value):
+        '''
+        The values one element contributes to each column in names
+        '''
+        if self.color:
+            if self.kind == 'color' and isinstance(value, str) and value:
+                return [float(channel) for channel in parse_color(value)]
+            return [float(channel) for channel in NO_COLOR]
+        if self.kind == 'category':
+            return [1.0 if value == category else 0.0 for category in self.categories]
+        if self.kind == 'measurement':
+            number = measurement_value(value)
+            return [float(number) if number is not None else self.missing]
+        number = to_number(value) if value is not None else None
+        return [float(number) if number is not None else math.nan]
+
+    def build(self, values):
+        '''
+        Full columns for a page: dict of name -> list with one float per value
+        '''
+        if self.kind == 'category':
+            return {name: [1.0 if v == category else 0.0 for v in values] for name, category in zip(self.names, self.categories)}
+        if self.color:
+            rgb = [self.cell(v) for v in values] if self.kind == 'color' else [[-1.0, -1.0, -1.0]] * len(values)
+            return {name: [c[channel] for c in rgb] for channel, name in enumerate(self.names)}
+        if self.kind == 'measurement':
+            numbers = [measurement_value(v) for v in values]
+            return {self.prop: [float(n) if n is not None else self.missing for n in numbers]}
+        numbers = [to_number(v) if v is not None else None for v in values]
+        return {self.prop: [float(n) if n is not None else math.nan for n in numbers]}
+
+
+def style_properties(records):
+    '''
+    Every style property used on the page, in order of first appearance
+    '''
+    return list(dict.fromkeys(key for style in records.values() for key in style))
+
+
+def style_table(records):
+    '''
+    Turn parsed style records into model columns (see StyleColumn for how each property is typed)
+    Missing numbers are NaN. Number and measurement columns come first, then colours, then categories.
+
+    Returns (ids, columns): the darwin ids in page order, and an ordered dict of
+    column name -> list of floats with one entry per id
+    '''
+    ids = list(records)
+    styles = list(records.values())
+
+    numeric_columns, color_columns, dummy_columns = {}, {}, {}
+    for prop in style_properties(records):
+        values = [style.get(prop) for style in styles]
+        column = StyleColumn(prop, values)
+        group = color_columns if column.color else dummy_columns if column.kind == 'category' else numeric_columns
+        group.update(column.build(values))
+
+    return ids, {**numeric_columns, **color_columns, **dummy_columns}
@@ -0,0 +1,171 @@
+'''
+Hyperparameter sweep over Predictor depth, width and learning rate
+
+Every configuration is trained with training_loop.train (same splits, early stopping and
+batch size) in a process pool with one torch thread per worker. Once the pool is done the
+trained models are timed one after another on a single thread, the way serving runs them,
+so latencies aren't skewed by workers still training.
+
+Writes SWEEP_RESULTS_PATH with validation MAE, training time, p50 inference latency (the median
+over LATENCY_REPEATS timings) and parameter count per configuration, and marks the Pareto-optimal
+ones (no other configuration is both more accurate and faster at batch 1).
+
+Run from backend_backup/train with: python sweep.py [--layers 2 4 8 16] [--widths 64 128 256] [--workers N]
+'''
+import argparse
+import contextlib
+import io
+import itertools
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import torch
+
+try:
+    from train.artifact import CURRENT_DIR
+    from train.inference_backends import EagerRunner, time_runner
+    from train.neural_net import Predictor
+    from train.training_loop import DATA_PATH, TRAIN_EPOCHES, TRAIN_BATCH_SIZE, load_splits, train, validation_mae
+except ImportError:
+    from artifact import CURRENT_DIR
+    from inference_backends import EagerRunner, time_runner
+    from neural_net import Predictor
+    from training_loop import DATA_PATH, TRAIN_EPOCHES, TRAIN_BATCH_SIZE, load_splits, train, validation_mae
+
+SWEEP_RESULTS_PATH = os.path.join(CURRENT_DIR, 'sweep_results.csv')
+# Default grid: neural_net.py's 16x256, final_driver.nn_model's 3 Linear x 128 (2 hidden layers) and the space between
+SWEEP_LAYERS = [2, 4, 8, 16]
+SWEEP_WIDTHS = [64, 128, 256]
+SWEEP_LRS = [0.002, 0.004]
+SWEEP_SEED = 0
+LATENCY_BATCH_SIZES = [1, 64, 4096]
+# Each latency is the median of this many time_runner p50s; a single one is too noisy to rank models on
+LATENCY_REPEATS = 5
+
+# Set in each worker by init_worker
+splits = None
+
+
+def init_worker(data_path):
+    global splits
+    # Workers share the machine's cores, more than one thread each only oversubscribes them
+    torch.set_num_threads(1)
+    torch.set_num_interop_threads(1)
+    splits = load_splits(data_path)
+
+
+def run_config(layers, width, lr, epochs, batch_size):
+    '''
+    Train one configuration in a worker
+    Returns (row of the results table without latencies, trained state_dict)
+    '''
+    columns, _, (X_train, y_train), (X_val, y_val), _ = splits
+    torch.manual_seed(SWEEP_SEED)
+    model = Predictor(len(columns), hidden_layers=layers, inner_layer_size=width)
+
+    start = time.perf_counter()
+    # Each run gets its own checkpoint file; train() removes it when it finishes.
+    # Its progress log is dropped, lines from parallel workers would only interleave
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        trained_epochs, best_mae = train(model, X_train, y_train, epochs, batch_size, lr, X_val, y_val,
+                                         checkpoint_path=os.path.join(tmp, 'checkpoint.pt'))
+    train_seconds = time.perf_counter() - start
+
+    row = {
+        'hidden_layers': layers,
+        'inner_layer_size': width,
+        'lr': lr,
+        'parameters': sum(p.numel() for p in model.parameters()),
+        'val_mae': round(best_mae if best_mae is not None else validation_mae(model, X_val, y_val), 4),
+        'epochs': trained_epochs,
+        'train_s': round(train_seconds, 1),
+    }
+    return row, model.state_dict()
+
+
+def time_configs(trained, num_features):
+    '''
+    Add p50_ms_<batch size> latencies to each (row, state_dict) of trained
+    Repeats go round all the models in turn, so a slow spell on the machine hits every model alike
+    '''
+    runners = []
+    for row, state_dict in trained:
+        model = Predictor(num_features, hidden_layers=row['hidden_layers'], inner_layer_size=row['inner_layer_size'])
+        model.load_state_dict(state_dict)
+        model.eval()
+        runners.append(EagerRunner(model))
+
+    timings = [{size: [] for size in LATENCY_BATCH_SIZES} for _ in trained]
+    for _ in range(LATENCY_REPEATS):
+        for runner, sizes in zip(runners, timings):
+            for size, p50s in sizes.items():
+                p50s.append(time_runner(runner, num_features, size, 50 if size < 1024 else 10)[0])
+
+    for (row, _), sizes in zip(trained, timings):
+        for size, p50s in sizes.items():
+            row[f'p50_ms_{size}'] = round(float(np.median(p50s)), 4)
+
+
+def pareto(results, cost='p50_ms_1'):
+    '''
+    True for configurations no other configuration beats on both validation MAE and cost
+    '''
+    return [
+        not any(o['val_mae'] <= r['val_mae'] and o[cost] <= r[cost] and (o['val_mae'] < r['val_mae'] or o[cost] < r[cost])
+                for o in results)
+        for r in results
+    ]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train a grid of Predictor shapes in parallel and tabulate accuracy vs cost")
+    parser.add_argument('--layers', type=int, nargs='+', default=SWEEP_LAYERS)
+    parser.add_argument('--widths', type=int, nargs='+', default=SWEEP_WIDTHS)
+    parser.add_argument('--lrs', type=float, nargs='+', default=SWEEP_LRS)
+    parser.add_argument('--epochs', type=int, default=TRAIN_EPOCHES)
+    parser.add_argument('--batch-size', type=int, default=TRAIN_BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--data', default=DATA_PATH, help="Training CSV")
+    parser.add_argument('--output', default=SWEEP_RESULTS_PATH)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    grid = list(itertools.product(args.layers, args.widths, args.lrs))
+    print(f"Sweeping {len(grid)} configurations on {args.workers} workers")
+
+    trained = []
+    start = time.perf_counter()
+    # spawn: forked children of a process that already initialised torch's thread pools can deadlock
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(args.workers, mp_context=context, initializer=init_worker, initargs=(args.data,)) as pool:
+        futures = {pool.submit(run_config, layers, width, lr, args.epochs, args.batch_size): (layers, width, lr)
+                   for layers, width, lr in grid}
+        for future in as_completed(futures):
+            row, state_dict = future.result()
+            trained.append((row, state_dict))
+            print(f"  {row['hidden_layers']:>2}x{row['inner_layer_size']:<4} lr {row['lr']:<7g} val MAE {row['val_mae']:.4f} "
+                  f"({row['epochs']} epochs, {row['train_s']}s)")
+
+    torch.set_num_threads(1)
+    num_features = len(load_splits(args.data)[0])
+    time_configs(trained, num_features)
+    results = [row for row, _ in trained]
+
+    for row, optimal in zip(results, pareto(results)):
+        row['pareto'] = optimal
+    table = pd.DataFrame(results).sort_values(['val_mae', 'p50_ms_1']).reset_index(drop=True)
+    table.to_csv(args.output, index=False)
+
+    print()
+    print(table.to_string(index=False))
+    print(f"\nSwept in {time.perf_counter() - start:.0f}s, results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,33 +5,178 @@ import torch.optim as optim
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_absolute_error
-from neural_net import Predictor
-from torch.utils.data import TensorDataset, DataLoader
+from neural_net import Predictor, build_predictor
+from artifact import CURRENT_DIR, ARTIFACT_PATH, STUDENT_ARTIFACT_PATH, SCALER_COLUMNS, DIV_TABLE, save_artifact, load_artifact, write_artifact, scaler_stats, scaler_from_stats
+from feature_encoder import FeatureEncoder
+from numpy_engine import NPZ_PATH, export_npz
+from inference_backends import EagerRunner, time_runner
+from feature_store import FeatureStore, ShardStream
 import numpy as np
+import argparse
 import os
+import time
 
+DATA_PATH = os.path.join(os.path.dirname(CURRENT_DIR), 'data', 'synthetic_data.csv')
 TRAIN_EPOCHES = 5000
+# Rows per optimizer step. The learning rate is scaled linearly from BASE_LR at BASE_BATCH_SIZE
+# (the old DataLoader setup), so larger batches take fewer, larger steps over the same epochs
+TRAIN_BATCH_SIZE = 128
+BASE_BATCH_SIZE = 32
+BASE_LR = 0.001
+LOG_INTERVAL = 500
+# Share of the run spent warming the learning rate up to its peak
+WARMUP_FRACTION = 0.05
 
-def train(model, X_train, y_train):
-    dataset = TensorDataset(X_train, y_train)
-    loader = DataLoader(dataset, batch_size=32, shuffle=True)
+# Validation MAE is measured every EVAL_INTERVAL epochs on VAL_FRACTION of the training split;
+# training stops after PATIENCE evaluations without an improvement of at least MIN_DELTA hits
+# and keeps the best weights seen
+EVAL_INTERVAL = 25
+VAL_FRACTION = 0.125
+PATIENCE = 8
+MIN_DELTA = 0.01
+# Model, optimizer and schedule state are saved here every CHECKPOINT_INTERVAL epochs, --resume picks it up
+CHECKPOINT_PATH = os.path.join(CURRENT_DIR, 'train_checkpoint.pt')
+CHECKPOINT_INTERVAL = 100
+# --store runs validate on a sample of this many validation rows held in memory
+STORE_VAL_ROWS = 50000
+
+# Distillation: student shape (the 3 Linear + ReLU, 128 unit net final_driver.nn_model used),
+# optimizer steps, and rows per step. Every step draws fresh inputs and labels them with the teacher.
+STUDENT_HIDDEN_LAYERS = 2
+STUDENT_INNER_LAYER_SIZE = 128
+DISTILL_STEPS = 4000
+DISTILL_BATCH_SIZE = 512
+# Page area the x/y of distillation inputs are drawn from, in px
+DISTILL_PAGE_SIZE = (1920, 1080)
+
+def scaled_lr(batch_size, base_lr=BASE_LR):
+    return base_lr * batch_size / BASE_BATCH_SIZE
+
+
+def validation_mae(model, X_val, y_val):
+    model.eval()
+    with torch.no_grad():
+        mae = (model(X_val) - y_val).abs().mean().item()
+    model.train()
+    return mae
+
+
+def save_checkpoint(path, model, optimizer, scheduler, epoch, settings, best):
+    # write_artifact goes through a temp file and os.replace, so an interrupted save keeps the previous checkpoint
+    write_artifact(path, {
+        'epoch': epoch,
+        'settings': settings,
+        'state_dict': model.state_dict(),
+        'optimizer': optimizer.state_dict(),
+        'scheduler': scheduler.state_dict(),
+        'best': best,
+        'rng_state': torch.get_rng_state(),
+    })
+
+
+def tensor_batches(X, y, batch_size):
+    permutation = torch.randperm(len(X))
+    for i in range(0, len(X), batch_size):
+        index = permutation[i:i + batch_size]
+        yield X[index], y[index]
+
+
+def train(model, X_train, y_train, epochs=TRAIN_EPOCHES, batch_size=TRAIN_BATCH_SIZE, lr=None,
+          X_val=None, y_val=None, resume=False, checkpoint_path=CHECKPOINT_PATH, stream=None,
+          eval_interval=EVAL_INTERVAL, patience=PATIENCE):
+    '''
+    Train on tensors held in memory: every epoch shuffles a permutation of row indices and slices
+    batches out of it, with no DataLoader or per-row Python work in the loop.
+    A one-cycle schedule warms the (batch-size scaled) learning rate up over WARMUP_FRACTION of the
+    run and anneals it to ~0; early stopping only starts counting once the warm-up is over.
+
+    X_val, y_val: Validation rows for early stopping; without them all epochs run
+    resume: Continue from checkpoint_path, with the epochs / batch size / lr / early stopping it was started with
+    Returns (epochs trained, counting any resumed ones; best validation MAE, None without validation rows)
+    stream: feature_store.ShardStream to read batches from instead of X_train / y_train (pass None for both)
+    eval_interval, patience: Validate every eval_interval epochs, stop after patience evaluations without improvement
+    '''
+    if stream is None:
+        X_train = X_train.contiguous()
+        y_train = y_train.contiguous()
+    rows = len(stream) if stream is not None else len(X_train)
+
+    checkpoint = None
+    if resume:
+        if not os.path.exists(checkpoint_path):
+            raise FileNotFoundError(f"No checkpoint to resume from at {checkpoint_path}")
+        checkpoint = torch.load(checkpoint_path, map_location=torch.device('cpu'))
+        epochs, batch_size, lr = (checkpoint['settings'][key] for key in ('epochs', 'batch_size', 'lr'))
+        # Checkpoints written before these were settings ran with the module defaults
+        eval_interval = checkpoint['settings'].get('eval_interval', EVAL_INTERVAL)
+        patience = checkpoint['settings'].get('patience', PATIENCE)
+
+    batch_size = min(batch_size, rows)
+    lr = lr or scaled_lr(batch_size)
+    steps_per_epoch = (rows + batch_size - 1) // batch_size
+    settings = {'epochs': epochs, 'batch_size': batch_size, 'lr': lr, 'eval_interval': eval_interval, 'patience': patience}
 
     loss_fn = nn.MSELoss()
-    optimizer = optim.AdamW(model.parameters(), lr=0.001)
+    optimizer = optim.AdamW(model.parameters(), lr=lr)
+    scheduler = optim.lr_scheduler.OneCycleLR(optimizer, max_lr=lr, total_steps=epochs * steps_per_epoch, pct_start=WARMUP_FRACTION)
+    warmup_epochs = int(epochs * WARMUP_FRACTION)
+    # Best validation MAE so far, its weights, and evaluations since it last improved
+    best = {'mae': float('inf'), 'epoch': None, 'state_dict': None, 'stale': 0}
+    first_epoch = 0
 
-    for epoch in range(TRAIN_EPOCHES):
-        model.train()
-        for batch_X, batch_y in loader:
-            # print(batch_X)
-            preds = model(batch_X)
-            loss = loss_fn(preds, batch_y)
+    if checkpoint is not None:
+        model.load_state_dict(checkpoint['state_dict'])
+        optimizer.load_state_dict(checkpoint['optimizer'])
+        scheduler.load_state_dict(checkpoint['scheduler'])
+        torch.set_rng_state(checkpoint['rng_state'])
+        best = checkpoint['best']
+        first_epoch = checkpoint['epoch'] + 1
+        print(f"Resuming from epoch {first_epoch} of {epochs} (best validation MAE {best['mae']:.4f})")
 
-            optimizer.zero_grad()
+    model.train()
+    start = time.perf_counter()
+    epoch = first_epoch - 1
+    for epoch in range(first_epoch, epochs):
+        for batch_X, batch_y in (stream.batches(batch_size) if stream is not None else tensor_batches(X_train, y_train, batch_size)):
+            loss = loss_fn(model(batch_X), batch_y)
+
+            optimizer.zero_grad(set_to_none=True)
             loss.backward()
             optimizer.step()
-        
-        if epoch % 20 == 0:
-            print(f"Epoch {epoch}, Loss: {loss.item():.4f}")
+            scheduler.step()
+
+        if epoch % LOG_INTERVAL == 0 or epoch == epochs - 1:
+            print(f"Epoch {epoch}, Loss: {loss.item():.4f}, LR: {scheduler.get_last_lr()[0]:.5f}")
+
+        stop = False
+        if X_val is not None and (epoch + 1) % eval_interval == 0:
+            mae = validation_mae(model, X_val, y_val)
+            if mae < best['mae'] - MIN_DELTA:
+                best = {'mae': mae, 'epoch': epoch, 'state_dict': {k: v.clone() for k, v in model.state_dict().items()}, 'stale': 0}
+            elif epoch >= warmup_epochs:
+                # Validation error is expected to wander while the learning rate is still rising
+                best['stale'] += 1
+            stop = best['stale'] >= patience
+            if stop:
+                print(f"Epoch {epoch}, validation MAE {mae:.4f}: no improvement in {patience * eval_interval} epochs, stopping")
+
+        if (epoch + 1) % CHECKPOINT_INTERVAL == 0 and not stop:
+            save_checkpoint(checkpoint_path, model, optimizer, scheduler, epoch, settings, best)
+        if stop:
+            break
+
+    elapsed = time.perf_counter() - start
+    trained = epoch + 1 - first_epoch
+    print(f"Trained {trained} epochs of {rows} rows (batch {batch_size}, lr {lr:g}) in {elapsed:.1f}s, "
+          f"{trained * rows / max(elapsed, 1e-9):,.0f} samples/s")
+
+    if best['state_dict'] is not None:
+        model.load_state_dict(best['state_dict'])
+        print(f"Kept the weights from epoch {best['epoch']} (validation MAE {best['mae']:.4f})")
+    # Finished runs have nothing left to resume
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return epoch + 1, best['mae'] if best['epoch'] is not None else None
 
 def eval(model, X_test, y_test):
     model.eval()
@@ -50,39 +195,58 @@ def test(x, y, div_id, scaler, color_scaler, size_scaler, model):
     print(f"[{x}, {y}, {div_id}]", model(torch.tensor([transformed[0, 0], transformed[0, 1], 0, st[0, 0], st[0, 1], st[0, 2], st[0, 3], 18,3.8,0,1,10,ct[0,0], ct[0, 1], ct[0, 2],36,42,35,1,0,0,0,0,0,0], dtype=torch.float32)))
 
 
-def main():
-    df = pd.read_csv("../data/synthetic_data.csv")
+def load_splits(path=DATA_PATH):
+    '''
+    Fit the scalers on the training CSV and split it into train / validation / test tensors
+    Returns (feature columns, scalers, (X_train, y_train), (X_val, y_val), (X_test, y_test))
+    '''
+    df = pd.read_csv(path)
     X = df[[col for col in df.columns if col != 'hits']].copy()
     y = df["hits"].values
 
-    scaler = StandardScaler()
-    X[["x", "y"]] = scaler.fit_transform(X[["x", "y"]].to_numpy())
+    scaler = StandardScaler().fit(X[SCALER_COLUMNS['scaler']].to_numpy())
+    color_scaler = StandardScaler().fit(X[SCALER_COLUMNS['color_scaler']].to_numpy())
+    size_scaler = StandardScaler().fit(X[SCALER_COLUMNS['size_scaler']].to_numpy())
+    scalers = {'scaler': scaler, 'color_scaler': color_scaler, 'size_scaler': size_scaler}
 
-    color_scaler = StandardScaler()
-    X[["backgroundColor_R", "backgroundColor_G", "backgroundColor_B"]] = color_scaler.fit_transform(X[["backgroundColor_R", "backgroundColor_G", "backgroundColor_B"]].to_numpy())
+    # Encode with the same FeatureEncoder the Sampler builds from the artifact
+    encoder = FeatureEncoder(X.columns, {name: scaler_stats(s, SCALER_COLUMNS[name]) for name, s in scalers.items()}, DIV_TABLE)
+    features = encoder.encode_frame(X)
 
-    size_scaler = StandardScaler()
-    X[["left", "top", "width", "height"]] = size_scaler.fit_transform(X[["left", "top", "width", "height"]].to_numpy())
-
-    X_train, X_test, y_train, y_test = train_test_split(X.values, y, test_size=0.2, random_state=42)
+    X_train, X_test, y_train, y_test = train_test_split(features, y, test_size=0.2, random_state=42)
     X_train = torch.tensor(X_train, dtype=torch.float32)
     X_test = torch.tensor(X_test, dtype=torch.float32)
 
     y_train = torch.tensor(y_train, dtype=torch.float32).view(-1, 1)
     y_test = torch.tensor(y_test, dtype=torch.float32).view(-1, 1)
+    # Early stopping watches a slice of the training split; the test split stays unseen until eval()
+    X_train, X_val, y_train, y_val = train_test_split(X_train, y_train, test_size=VAL_FRACTION, random_state=42)
 
     # print(X_train, X_test, y_train, y_test)
+    return X.columns, scalers, (X_train, y_train), (X_val, y_val), (X_test, y_test)
+
 
-    model = Predictor(len([col for col in df.columns if col != 'hits']))
+def main(epochs=TRAIN_EPOCHES, batch_size=TRAIN_BATCH_SIZE, lr=None, resume=False,
+         eval_interval=EVAL_INTERVAL, patience=PATIENCE):
+    columns, scalers, (X_train, y_train), (X_val, y_val), (X_test, y_test) = load_splits()
 
-    if os.path.exists('train.pth'):
+    model = Predictor(len(columns))
+
+    if os.path.exists('train.pth') and not resume:
         model.load_state_dict(torch.load('train.pth'))
         print("Model loaded successfully")
     else:
-        train(model, X_train, y_train)
+        train(model, X_train, y_train, epochs, batch_size, lr, X_val, y_val, resume=resume,
+              eval_interval=eval_interval, patience=patience)
         eval(model, X_test, y_test)
         torch.save(model.state_dict(), 'train.pth')
 
+    # Bundle weights, scalers, feature order and div table for the Sampler
+    save_artifact(ARTIFACT_PATH, model, columns, scalers)
+    print(f"Model artifact written to {ARTIFACT_PATH}")
+    export_npz(load_artifact(ARTIFACT_PATH), NPZ_PATH)
+    print(f"Numpy weights written to {NPZ_PATH}")
+
     # a = scaler.transform(np.array([[5, 100]]))
     # b = scaler.transform(np.array([[3, 200]]))
 
@@ -90,7 +254,7 @@ def main():
     # # print("[3, 100, 1]", model(torch.tensor([3, 100, 1], dtype=torch.float32)))
     # print("[3, 200, 0]", model(torch.tensor([b[0, 0], b[0, 1], 0], dtype=torch.float32)))
 
-    test(5, 100, 0, scaler, color_scaler, size_scaler, model)
+    test(5, 100, 0, scalers['scaler'], scalers['color_scaler'], scalers['size_scaler'], model)
     # test(3, 200, 0, scaler, model)
     # test(3, 100, 1, scaler, model)
     # test(5, 50, 0, scaler, model)
@@ -101,7 +265,138 @@ def main():
     # test(30, 500, 2, scaler, model)
 
 
+def main_store(store_path, epochs=TRAIN_EPOCHES, batch_size=TRAIN_BATCH_SIZE, lr=None, resume=False,
+               eval_interval=EVAL_INTERVAL, patience=PATIENCE):
+    '''
+    Train on a feature_store.py store without loading it: scalers are fitted shard by shard,
+    batches are streamed from the memory-mapped arrays and the test MAE is computed the same way
+    '''
+    store = FeatureStore(store_path)
+    train_shards, val_shards, test_shards = store.split(test_size=0.2, val_fraction=VAL_FRACTION)
+    scalers = store.fit_scalers(train_shards)
+    encoder = FeatureEncoder(store.columns, {name: scaler_stats(s, SCALER_COLUMNS[name]) for name, s in scalers.items()}, DIV_TABLE)
+
+    features, labels = store.sample(val_shards, STORE_VAL_ROWS)
+    X_val, y_val = ShardStream(store, val_shards, encoder).encode(features, labels)
+    stream = ShardStream(store, train_shards, encoder)
+    print(f"{len(store)} rows in {store_path}: {len(stream)} train rows in {len(train_shards)} shards, "
+          f"{len(X_val)} validation rows sampled")
+
+    model = Predictor(len(store.columns))
+    train(model, None, None, epochs, batch_size, lr, X_val, y_val, resume=resume, stream=stream,
+          eval_interval=eval_interval, patience=patience)
+    print("Test MAE:", ShardStream(store, test_shards, encoder).mae(model))
+    torch.save(model.state_dict(), 'train.pth')
+
+    save_artifact(ARTIFACT_PATH, model, store.columns, scalers)
+    print(f"Model artifact written to {ARTIFACT_PATH}")
+    export_npz(load_artifact(ARTIFACT_PATH), NPZ_PATH)
+    print(f"Numpy weights written to {NPZ_PATH}")
+
 
-#if __name__ == "__main__":
-main()
+def distill_inputs(X, encoder, batch_size, rng):
+    '''
+    Dense inputs around the training data: real rows, half of them moved to a random
+    spot on the page, which is what serving asks for (drags and heatmaps)
+    '''
+    rows = X[rng.integers(0, len(X), size=batch_size)].copy()
+    moved = batch_size // 2
+    points = rng.uniform((0, 0), DISTILL_PAGE_SIZE, size=(moved, 2))
+    rows[:moved, encoder.xy_index] = encoder.transform_columns(points, encoder.xy_index)
+    return torch.from_numpy(rows)
+
+
+def distill(hidden_layers, inner_layer_size, steps=DISTILL_STEPS, batch_size=DISTILL_BATCH_SIZE):
+    '''
+    Train a small Predictor to reproduce the teacher in ARTIFACT_PATH and save it to STUDENT_ARTIFACT_PATH
+    The student keeps the teacher's features and scalers, so Sampler(artifact_path=STUDENT_ARTIFACT_PATH) serves it as is
+    '''
+    torch.manual_seed(0)
+    rng = np.random.default_rng(0)
+
+    artifact = load_artifact(ARTIFACT_PATH)
+    teacher = build_predictor(artifact)
+    teacher.load_state_dict(artifact['state_dict'])
+    teacher.eval()
+
+    # Encode the training CSV with the teacher's own schema so both see the same input space
+    encoder = FeatureEncoder.from_artifact(artifact)
+    df = pd.read_csv(DATA_PATH)
+    X = encoder.encode_frame(df)
+    y = df["hits"].to_numpy(dtype=np.float32)
+    scalers = {name: scaler_from_stats(stats) for name, stats in artifact['scalers'].items()}
+
+    student = Predictor(len(artifact['features']), hidden_layers=hidden_layers, inner_layer_size=inner_layer_size)
+    loss_fn = nn.MSELoss()
+    optimizer = optim.AdamW(student.parameters(), lr=0.001)
+    scheduler = optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=steps)
+
+    for step in range(steps):
+        batch_X = distill_inputs(X, encoder, batch_size, rng)
+        with torch.no_grad():
+            targets = teacher(batch_X)
+
+        student.train()
+        loss = loss_fn(student(batch_X), targets)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        scheduler.step()
+
+        if step % 500 == 0:
+            print(f"Step {step}, Distill loss: {loss.item():.4f}")
+
+    student.eval()
+    save_artifact(STUDENT_ARTIFACT_PATH, student, artifact['features'], scalers, artifact['div_table'])
+    print(f"Student artifact written to {STUDENT_ARTIFACT_PATH}")
+
+    # Report: agreement with the teacher on unseen dense inputs, error on the real labels, and latency
+    torch.set_num_threads(1)
+    teacher_runner, student_runner = EagerRunner(teacher), EagerRunner(student)
+    dense = distill_inputs(X, encoder, 8192, np.random.default_rng(1)).numpy()
+    gap = np.abs(student_runner(dense) - teacher_runner(dense))
+
+    print()
+    print(f"Student {hidden_layers}x{inner_layer_size}, parameters: "
+          f"teacher {sum(p.numel() for p in teacher.parameters())}, student {sum(p.numel() for p in student.parameters())}")
+    print(f"Student vs teacher on dense inputs: MAE {gap.mean():.4f}, max {gap.max():.4f}")
+    print(f"MAE vs labels: teacher {np.abs(teacher_runner(X) - y).mean():.4f}, student {np.abs(student_runner(X) - y).mean():.4f}")
+    print(f"{'batch':>6} {'teacher ms':>12} {'student ms':>12} {'speedup':>8}")
+    for size in [1, 64, 4096]:
+        teacher_ms, _ = time_runner(teacher_runner, X.shape[1], size)
+        student_ms, _ = time_runner(student_runner, X.shape[1], size)
+        print(f"{size:>6} {teacher_ms:>12.3f} {student_ms:>12.3f} {teacher_ms / student_ms:>7.1f}x")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the Predictor, or distill it into a smaller one")
+    parser.add_argument('--distill', action='store_true',
+                        help=f"Distill the model in {os.path.basename(ARTIFACT_PATH)} into {os.path.basename(STUDENT_ARTIFACT_PATH)}")
+    parser.add_argument('--hidden-layers', type=int, default=STUDENT_HIDDEN_LAYERS)
+    parser.add_argument('--inner-layer-size', type=int, default=STUDENT_INNER_LAYER_SIZE)
+    parser.add_argument('--steps', type=int, default=DISTILL_STEPS)
+    parser.add_argument('--epochs', type=int, default=TRAIN_EPOCHES)
+    parser.add_argument('--batch-size', type=int, default=TRAIN_BATCH_SIZE)
+    parser.add_argument('--eval-interval', type=int, default=EVAL_INTERVAL,
+                        help="Epochs between validation MAE checks for early stopping")
+    parser.add_argument('--patience', type=int, default=PATIENCE,
+                        help="Validation checks without improvement before training stops")
+    parser.add_argument('--resume', action='store_true',
+                        help=f"Continue an interrupted training run from {os.path.basename(CHECKPOINT_PATH)}")
+    parser.add_argument('--lr', type=float, default=None,
+                        help=f"Peak learning rate, defaults to {BASE_LR} scaled by batch size / {BASE_BATCH_SIZE}")
+    parser.add_argument('--store', default=None,
+                        help="Stream training rows from a feature_store.py directory instead of loading the training CSV")
+    return parser.parse_args()
+
+
+# Guarded so sweep.py can import train() and load_splits()
+if __name__ == "__main__":
+    args = parse_args()
+    if args.distill:
+        distill(args.hidden_layers, args.inner_layer_size, args.steps)
+    elif args.store:
+        main_store(args.store, args.epochs, args.batch_size, args.lr, args.resume, args.eval_interval, args.patience)
+    else:
+        main(args.epochs, args.batch_size, args.lr, args.resume, args.eval_interval, args.patience)
 
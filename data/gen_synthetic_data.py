@@ -1,105 +1,222 @@
+import argparse
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-import random
-
-def generate_synthetic_data(num_rows=500):
-    data = []
-    # Fixed seed for reproducibility
-    np.random.seed(42)
-    random.seed(42)
-
-    def calculate_contrast(bg_r, bg_g, bg_b, fg_r, fg_g, fg_b):
-        def lum(c):
-            c = c / 255.0
-            return c / 12.92 if c <= 0.03928 else ((c + 0.055) / 1.055) ** 2.4
-        L1 = 0.2126 * lum(bg_r) + 0.7152 * lum(bg_g) + 0.0722 * lum(bg_b)
-        L2 = 0.2126 * lum(fg_r) + 0.7152 * lum(fg_g) + 0.0722 * lum(fg_b)
-        return (max(L1, L2) + 0.05) / (min(L1, L2) + 0.05)
-
-    for i in range(num_rows):
-        # 1. Assign Category
-        cat = random.choice([0, 1, 2, 3, 4])
-        
-        # 2. Determine "Sweet Spot" (Target x,y) based on Category
-        if cat == 0:   # Top-Left (Logo/Menu)
-            center_x, center_y, sigma_x, sigma_y = 0, 0, 30, 30
-        elif cat == 1: # Nav List (Top-Left quadrant)
-            center_x, center_y, sigma_x, sigma_y = 40, 140, 40, 40
-        elif cat == 2: # Context Menu (Mid-Left)
-            center_x, center_y, sigma_x, sigma_y = 40, 240, 40, 60
-        elif cat == 3: # Primary Action (Mid-Left/Center)
-            center_x, center_y, sigma_x, sigma_y = 40, 300, 40, 40
-        elif cat == 4: # FAB/Call-to-Action (Bottom-Right area)
-            center_x, center_y, sigma_x, sigma_y = 120, 470, 50, 40
-
-        # Generate Position with Noise
-        x = max(0, int(np.random.normal(center_x, sigma_x)))
-        y = max(0, int(np.random.normal(center_y, sigma_y)))
-
-        # 3. Generate Dimensions (15% chance of being "bad/too small")
-        if random.random() < 0.15:
-            width = random.randint(20, 90)
-            height = random.randint(10, 35)
-        else:
-            width = random.randint(100, 450)
-            height = random.randint(45, 120)
-
-        # 4. Generate Font Size & Colors
-        fontSize = round(random.uniform(8, 11), 1) if random.random() < 0.15 else round(random.uniform(14, 28), 1)
-        bg_r, bg_g, bg_b = random.randint(0, 255), random.randint(0, 255), random.randint(0, 255)
-        
-        # Color Logic: 15% chance of low contrast
-        if random.random() < 0.15:
-            fg_r = max(0, min(255, bg_r + random.randint(-40, 40)))
-            fg_g = max(0, min(255, bg_g + random.randint(-40, 40)))
-            fg_b = max(0, min(255, bg_b + random.randint(-40, 40)))
-        else:
-            # High contrast logic
-            yiq = ((bg_r*299)+(bg_g*587)+(bg_b*114))/1000
-            fg_r, fg_g, fg_b = (0,0,0) if yiq >= 128 else (255,255,255)
-
-        # --- SCORING LOGIC (The "Ground Truth") ---
-        base_score = 100
-        
-        # Distance Penalty (Euclidean or Manhatten based on shape)
-        if cat == 0:
-            dist = np.sqrt((x-0)**2 + (y-0)**2)
-            score = base_score - (dist * 0.8) 
-        elif cat == 1:
-            dist = np.sqrt((x-40)**2 + (y-140)**2)
-            score = base_score - (dist * 0.8)
-        elif cat == 2:
-            score = base_score - (abs(x - 40) * 0.5) - (abs(y - 240) * 0.6)
-        elif cat == 3:
-            dist = np.sqrt((x-40)**2 + (y-300)**2)
-            score = base_score - (dist * 0.8)
-        elif cat == 4:
-            score = base_score - (abs(x - 120) * 0.84) - (abs(y - 470) * 0.8)
-
-        # Feature Penalties
-        if width < 100 or height < 40: score *= 0.1  # Too small
-        if fontSize < 12: score *= 0.4               # Unreadable
-        if calculate_contrast(bg_r, bg_g, bg_b, fg_r, fg_g, fg_b) < 3.0: score *= 0.1 # Low contrast
-
-        # Finalize
-        hits = int(max(0, min(100, score + random.uniform(-4, 4))))
-
-        data.append([
-            x, y, cat, x, y, width, height, 
-            random.choice([16, 24]), fontSize, -1, -1, random.choice([0, 4, 8, 16]),
-            bg_r, bg_g, bg_b, fg_r, fg_g, fg_b,
-            1, 1, 1, 1, random.choice([0, 1]), random.choice([0, 1]), 1, hits
-        ])
-
-    columns = [
-        "x","y","div_category","left","top","width","height","padding","fontSize","margin",
-        "lineHeight","borderRadius","backgroundColor_R","backgroundColor_G","backgroundColor_B",
-        "color_R","color_G","color_B","position_absolute","display_flex","alignItems_center",
-        "boxSizing_border-box","fontWeight_bold","border_none","cursor_pointer","hits"
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # Parquet output is optional, 'npy' and 'csv' need nothing beyond numpy/pandas
+    pa = None
+
+# Rows generated (and written) per chunk; each chunk has its own random stream so the output
+# only depends on the seed, not on the chunk order or the number of workers
+CHUNK_ROWS = 1_000_000
+
+# Per category: sweet spot (center_x, center_y) and its spread (sigma_x, sigma_y)
+#   0 Top-Left (Logo/Menu), 1 Nav List (Top-Left quadrant), 2 Context Menu (Mid-Left),
+#   3 Primary Action (Mid-Left/Center), 4 FAB/Call-to-Action (Bottom-Right area)
+CENTERS = np.array([[0, 0], [40, 140], [40, 240], [40, 300], [120, 470]], dtype=np.float64)
+SIGMAS = np.array([[30, 30], [40, 40], [40, 60], [40, 40], [50, 40]], dtype=np.float64)
+# Distance penalty per category: Euclidean distance * EUCLID_WEIGHT, or Manhattan with (x, y) weights
+EUCLID_WEIGHT = 0.8
+MANHATTAN_WEIGHTS = {2: (0.5, 0.6), 4: (0.84, 0.8)}
+
+COLUMNS = [
+    "x","y","div_category","left","top","width","height","padding","fontSize","margin",
+    "lineHeight","borderRadius","backgroundColor_R","backgroundColor_G","backgroundColor_B",
+    "color_R","color_G","color_B","position_absolute","display_flex","alignItems_center",
+    "boxSizing_border-box","fontWeight_bold","border_none","cursor_pointer","hits"
+]
+# fontSize is the only non-integer column
+DTYPES = {col: np.float32 if col == 'fontSize' else np.int32 for col in COLUMNS}
+
+
+def luminance(c):
+    c = c / 255.0
+    return np.where(c <= 0.03928, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+
+
+def calculate_contrast(bg, fg):
+    '''
+    WCAG contrast ratio of (N, 3) background and foreground RGB arrays
+    '''
+    weights = np.array([0.2126, 0.7152, 0.0722])
+    L1 = luminance(bg) @ weights
+    L2 = luminance(fg) @ weights
+    return (np.maximum(L1, L2) + 0.05) / (np.minimum(L1, L2) + 0.05)
+
+
+def generate_chunk(num_rows, rng):
+    '''
+    num_rows rows of synthetic placements with their "ground truth" hits, as a dict of column arrays
+    '''
+    n = num_rows
+    # 1. Assign Category
+    cat = rng.integers(0, 5, size=n)
+
+    # 2. Position with noise around the category's sweet spot
+    position = rng.normal(CENTERS[cat], SIGMAS[cat])
+    x = np.maximum(0, np.trunc(position[:, 0])).astype(np.int64)
+    y = np.maximum(0, np.trunc(position[:, 1])).astype(np.int64)
+
+    # 3. Dimensions (15% chance of being "bad/too small")
+    small = rng.random(n) < 0.15
+    width = np.where(small, rng.integers(20, 91, size=n), rng.integers(100, 451, size=n))
+    height = np.where(small, rng.integers(10, 36, size=n), rng.integers(45, 121, size=n))
+
+    # 4. Font size & colors, 15% chance each of an unreadable font and of low contrast
+    tiny_font = rng.random(n) < 0.15
+    fontSize = np.round(np.where(tiny_font, rng.uniform(8, 11, size=n), rng.uniform(14, 28, size=n)), 1)
+    bg = rng.integers(0, 256, size=(n, 3))
+
+    low_contrast = rng.random(n) < 0.15
+    yiq = (bg[:, 0] * 299 + bg[:, 1] * 587 + bg[:, 2] * 114) / 1000
+    fg = np.where(yiq[:, None] >= 128, 0, 255)
+    near_bg = np.clip(bg + rng.integers(-40, 41, size=(n, 3)), 0, 255)
+    fg = np.where(low_contrast[:, None], near_bg, fg)
+
+    # --- SCORING LOGIC (The "Ground Truth") ---
+    dx = x - CENTERS[cat, 0]
+    dy = y - CENTERS[cat, 1]
+    score = 100 - np.sqrt(dx ** 2 + dy ** 2) * EUCLID_WEIGHT
+    for category, (wx, wy) in MANHATTAN_WEIGHTS.items():
+        rows = cat == category
+        score[rows] = 100 - np.abs(dx[rows]) * wx - np.abs(dy[rows]) * wy
+
+    # Feature penalties: too small, unreadable, low contrast
+    score = np.where((width < 100) | (height < 40), score * 0.1, score)
+    score = np.where(fontSize < 12, score * 0.4, score)
+    score = np.where(calculate_contrast(bg, fg) < 3.0, score * 0.1, score)
+
+    hits = np.clip(score + rng.uniform(-4, 4, size=n), 0, 100).astype(np.int64)
+
+    ones = np.ones(n, dtype=np.int64)
+    values = [
+        x, y, cat, x, y, width, height,
+        rng.choice([16, 24], size=n), fontSize, -ones, -ones, rng.choice([0, 4, 8, 16], size=n),
+        bg[:, 0], bg[:, 1], bg[:, 2], fg[:, 0], fg[:, 1], fg[:, 2],
+        ones, ones, ones, ones, rng.integers(0, 2, size=n), rng.integers(0, 2, size=n), ones, hits,
     ]
-    
-    return pd.DataFrame(data, columns=columns)
+    return {col: value.astype(DTYPES[col]) for col, value in zip(COLUMNS, values)}
+
+
+def chunk_bounds(num_rows, chunk_rows=CHUNK_ROWS):
+    return [(start, min(start + chunk_rows, num_rows)) for start in range(0, num_rows, chunk_rows)]
+
+
+def chunk_rng(seed, index):
+    return np.random.default_rng([seed, index])
+
+
+def generate_synthetic_data(num_rows=500, seed=42):
+    '''
+    The whole dataset as one DataFrame (same rows write_dataset produces for this seed)
+    '''
+    chunks = [generate_chunk(end - start, chunk_rng(seed, i)) for i, (start, end) in enumerate(chunk_bounds(num_rows))]
+    return pd.DataFrame({col: np.concatenate([chunk[col] for chunk in chunks]) for col in COLUMNS})
+
+
+def fill_npy_chunk(path, index, start, end, seed):
+    '''
+    Worker task for the npy format: generate one chunk straight into the column files
+    '''
+    chunk = generate_chunk(end - start, chunk_rng(seed, index))
+    for col in COLUMNS:
+        column = np.load(os.path.join(path, f'{col}.npy'), mmap_mode='r+')
+        column[start:end] = chunk[col]
+        column.flush()
+        del column
+    return end - start
+
+
+def make_chunk(num_rows, seed, index):
+    return generate_chunk(num_rows, chunk_rng(seed, index))
+
+
+def ordered_chunks(bounds, seed, pool=None, workers=1):
+    '''
+    Yields the chunks of bounds in order. With a pool, up to workers chunks are generated ahead,
+    so memory holds about workers chunks however many there are in total.
+    '''
+    if pool is None:
+        for i, (start, end) in enumerate(bounds):
+            yield make_chunk(end - start, seed, i)
+        return
+
+    pending = deque()
+    for i, (start, end) in enumerate(bounds):
+        pending.append(pool.submit(make_chunk, end - start, seed, i))
+        if len(pending) >= workers:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def write_dataset(path, num_rows, seed=42, fmt='npy', workers=1, chunk_rows=CHUNK_ROWS):
+    '''
+    Generate num_rows rows chunk by chunk and write them to path
+
+    fmt: 'npy'     directory with one <column>.npy per column, readable with np.load(..., mmap_mode='r')
+         'parquet' one Parquet file, a row group per chunk (needs pyarrow)
+         'csv'     the training CSV format
+    workers: Processes generating chunks in parallel (1 generates in this process)
+    '''
+    bounds = chunk_bounds(num_rows, chunk_rows)
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        if fmt == 'npy':
+            os.makedirs(path, exist_ok=True)
+            # Preallocate every column, then chunks (possibly from several processes) fill their own slice
+            for col in COLUMNS:
+                np.lib.format.open_memmap(os.path.join(path, f'{col}.npy'), mode='w+', dtype=DTYPES[col], shape=(num_rows,)).flush()
+            tasks = [(path, i, start, end, seed) for i, (start, end) in enumerate(bounds)]
+            if pool is None:
+                for task in tasks:
+                    fill_npy_chunk(*task)
+            else:
+                list(pool.map(fill_npy_chunk, *zip(*tasks)))
+            return
+
+        # Chunks come back in order, so the file is the same whatever the number of workers
+        chunks = ordered_chunks(bounds, seed, pool, workers)
+
+        if fmt == 'parquet':
+            if pa is None:
+                raise ImportError("pyarrow is not installed, use fmt='npy' or 'csv'")
+            writer = None
+            for chunk in chunks:
+                table = pa.table(chunk)
+                writer = writer or pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+            if writer is not None:
+                writer.close()
+        elif fmt == 'csv':
+            for i, chunk in enumerate(chunks):
+                pd.DataFrame(chunk).to_csv(path, index=False, mode='w' if i == 0 else 'a', header=i == 0)
+        else:
+            raise ValueError(f"Unknown format '{fmt}', expected 'npy', 'parquet' or 'csv'")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate synthetic placement / hits training data")
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--format', choices=['csv', 'npy', 'parquet'], default='csv')
+    parser.add_argument('--output', default=None, help="Defaults to synthetic_data.csv / synthetic_data_npy / synthetic_data.parquet")
+    parser.add_argument('--workers', type=int, default=1, help="Processes generating chunks in parallel")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    return parser.parse_args()
+
 
-# Generate and print
-df = generate_synthetic_data(500)
-print(df.to_csv('synthetic_data.csv',index=False))
+if __name__ == '__main__':
+    args = parse_args()
+    output = args.output or {'csv': 'synthetic_data.csv', 'npy': 'synthetic_data_npy', 'parquet': 'synthetic_data.parquet'}[args.format]
+    write_dataset(output, args.rows, args.seed, args.format, args.workers, args.chunk_rows)
+    print(f"{args.rows} rows written to {output}")
@@ -1,6 +1,6 @@
-import csv
-import random
+import argparse
 import numpy as np
+import pandas as pd
 
 NUM_POINTS = 500
 STD_POS = 0.5
@@ -9,77 +9,65 @@ STD_CLICKS = 5
 output_file = "test_data.csv"
 
 # Anchor definitions
-div0_anchors = [
+div0_anchors = np.array([
     (5, 5, 50),
     (5, 100, 100),
     (50, 2, 25),
     (3, 200, 5),
-]
+], dtype=np.float64)
 
-div1_anchors = [
+div1_anchors = np.array([
     (5, 5, 100),
     (3, 100, 30),
-]
-
-# Keep track of unique user IDs
-used_user_ids = set()
-
-def generate_unique_user_id():
-    while True:
-        uid = random.randint(100000, 999999)
-        if uid not in used_user_ids:
-            used_user_ids.add(uid)
-            return uid
-
-def sample_near(x, y, clicks):
-    new_x = max(0, np.random.normal(x, STD_POS))
-    new_y = max(0, np.random.normal(y, STD_POS))
-    new_clicks = max(0, int(np.random.normal(clicks, STD_CLICKS)))
-    return new_x, new_y, new_clicks
-
-rows = []
-
-for i in range(NUM_POINTS):
-    div_id = random.randint(0, 4)
-
-    if div_id == 0:
-        anchor = random.choice(div0_anchors)
-        x, y, clicks = sample_near(*anchor)
-
-    elif div_id == 1:
-        anchor = random.choice(div1_anchors)
-        x, y, clicks = sample_near(*anchor)
-
-    elif div_id == 2:
-        # Bottom-heavy placement (y large)
-        x = np.random.normal(50, STD_POS)
-        y = np.random.normal(300, STD_POS)  # bottom
-        clicks = max(0, int(np.random.normal(60, STD_CLICKS)))
-
-    elif div_id == 3:
-        # Low activity overall
-        x = np.random.normal(25, STD_POS)
-        y = np.random.normal(50, STD_POS)
-        clicks = max(0, int(np.random.normal(5, 2)))
-
-    else:  # div_id == 4
-        # Fully random placement and clicks
-        x = max(0, random.uniform(0, 300))
-        y = max(0, random.uniform(0, 300))
-        clicks = random.randint(0, 150)
-
-    user_id = generate_unique_user_id()
-
-    train_split = 1
-    if i > (NUM_POINTS * 0.75):
-        train_split = 0
-     
-    rows.append([x, y, div_id, user_id, clicks, train_split])
-
-# Write CSV
-with open(output_file, mode="w", newline="") as f:
-    writer = csv.writer(f)
-    writer.writerow(["x", "y", "div id", "user id", "clicks", "train"])
-    writer.writerows(rows)
-
-print(f"{NUM_POINTS} data points written to {output_file}")
+], dtype=np.float64)
+
+
+def generate_div_data(num_points=NUM_POINTS, seed=None):
+    rng = np.random.default_rng(seed)
+    div_id = rng.integers(0, 5, size=num_points)
+    x = np.empty(num_points)
+    y = np.empty(num_points)
+    clicks = np.empty(num_points, dtype=np.int64)
+
+    # Divs 0 and 1: a random anchor per row, position and clicks jittered around it
+    for div, anchors in ((0, div0_anchors), (1, div1_anchors)):
+        rows = np.flatnonzero(div_id == div)
+        anchor = anchors[rng.integers(0, len(anchors), size=len(rows))]
+        x[rows] = np.maximum(0, rng.normal(anchor[:, 0], STD_POS))
+        y[rows] = np.maximum(0, rng.normal(anchor[:, 1], STD_POS))
+        clicks[rows] = np.maximum(0, rng.normal(anchor[:, 2], STD_CLICKS).astype(np.int64))
+
+    # Bottom-heavy placement (y large)
+    rows = np.flatnonzero(div_id == 2)
+    x[rows] = rng.normal(50, STD_POS, size=len(rows))
+    y[rows] = rng.normal(300, STD_POS, size=len(rows))
+    clicks[rows] = np.maximum(0, rng.normal(60, STD_CLICKS, size=len(rows)).astype(np.int64))
+
+    # Low activity overall
+    rows = np.flatnonzero(div_id == 3)
+    x[rows] = rng.normal(25, STD_POS, size=len(rows))
+    y[rows] = rng.normal(50, STD_POS, size=len(rows))
+    clicks[rows] = np.maximum(0, rng.normal(5, 2, size=len(rows)).astype(np.int64))
+
+    # Fully random placement and clicks
+    rows = np.flatnonzero(div_id == 4)
+    x[rows] = rng.uniform(0, 300, size=len(rows))
+    y[rows] = rng.uniform(0, 300, size=len(rows))
+    clicks[rows] = rng.integers(0, 151, size=len(rows))
+
+    # Unique 6 digit user ids, drawn without replacement instead of retrying on collisions
+    user_id = rng.choice(900000, size=num_points, replace=False) + 100000
+    train_split = (np.arange(num_points) <= num_points * 0.75).astype(np.int64)
+
+    return pd.DataFrame({"x": x, "y": y, "div id": div_id, "user id": user_id, "clicks": clicks, "train": train_split})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate per-div click test data")
+    parser.add_argument('--points', type=int, default=NUM_POINTS)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', default=output_file)
+    args = parser.parse_args()
+
+    generate_div_data(args.points, args.seed).to_csv(args.output, index=False)
+    print(f"{args.points} data points written to {args.output}")
@@ -1,12 +1,22 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from typing import Optional, Dict, Any
 import random
 from train.model_sampler import Sampler
-from google import genai
+import asyncio
+import json
 import os
 import re
+import sys
+
+# The Gemini client is shared with backend_backup/; take it from there unless a copy was deployed next to this file
+try:
+    from llm_client import GeminiClient, FenceStripper
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend_backup'))
+    from llm_client import GeminiClient, FenceStripper
 
 app = FastAPI()
 
@@ -20,13 +30,18 @@ app.add_middleware(
 )
 
 api_key = os.getenv("GEMINI_API_KEY")  # or replace with your key string
-client = genai.Client(api_key=api_key)
+# Async client with a shared session, per-call timeout and in-flight cap (see llm_client.py)
+gemini = GeminiClient(api_key=api_key, model='gemini-3-flash-preview')
+
+@app.on_event("shutdown")
+async def close_gemini():
+    await gemini.aclose()
 
 class HitRequest(BaseModel):
     x: Optional[float]
     y: Optional[float]
     div_id: Optional[str]
-    predict_other: Optional[Dict[str, Any]]
+    predict_other: Optional[Dict[str, Any]] = None
 
 class RunPipelineRequest(BaseModel):
     html: str
@@ -47,31 +62,71 @@ class GenerateCodeRequest(BaseModel):
     code: str
 
 
-@app.post("/api/generate_code")
-async def generate_code(request: GenerateCodeRequest):
-    try:
-        full_prompt = f"""
+def build_prompt(request):
+    return f"""
         You are an expert React developer.
         Update this App.jsx code based on this request: "{request.prompt}"
         EXISTING CODE: {request.code}
         Return ONLY the raw code string. No markdown.
         """
 
-        response = client.models.generate_content(
-            model='gemini-3-flash-preview',
-            contents=full_prompt)
-        text = response.text
+
+@app.post("/api/generate_code")
+async def generate_code(request: GenerateCodeRequest):
+    try:
+        text = await gemini.generate(build_prompt(request))
 
         # Remove markdown code fences if present
         cleaned_code = re.sub(r"```jsx|```", "", text).strip()
 
         return {"code": cleaned_code}
 
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Gemini did not respond within {gemini.timeout} seconds")
+
     except Exception as error:
         print("❌ SERVER CRASH DETAILS:")
         print("Message:", str(error))
         raise HTTPException(status_code=500, detail=str(error))
 
+
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@app.post("/api/generate_code_stream")
+async def generate_code_stream(request: GenerateCodeRequest):
+    '''
+    Same as /api/generate_code, but sends the code as server-sent events while Gemini writes it:
+    "data: {"text": ...}" for each chunk, then "event: done" (or "event: error" with a detail)
+    '''
+    full_prompt = build_prompt(request)
+
+    async def events():
+        stripper = FenceStripper()
+        try:
+            async for chunk in gemini.generate_stream(full_prompt):
+                text = stripper.feed(chunk)
+                if text:
+                    yield sse_event({"text": text})
+
+            text = stripper.finish()
+            if text:
+                yield sse_event({"text": text})
+            yield sse_event({}, event="done")
+
+        except asyncio.TimeoutError:
+            yield sse_event({"detail": f"Gemini did not respond within {gemini.timeout} seconds"}, event="error")
+
+        except Exception as error:
+            print("❌ STREAM ERROR:", str(error))
+            yield sse_event({"detail": str(error)}, event="error")
+
+    # X-Accel-Buffering stops reverse proxies from holding the stream back until it ends
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 if __name__ == '__main__':
     import uvicorn
     uvicorn.run(app, host='0.0.0.0', port=8001)
@@ -382,6 +382,12 @@ const EditorWorkspace = ({ fileTree, openTabs, activeTab, fileContents, onFileSe
 };
 
 // --- 3. MAIN DASHBOARD ---
+// Map ID numbers to strings if needed (legacy support)
+const MOCK_DIV_IDS = ["nav-main", "hero-text", "btn-cta", "description", "btn-cta-2"];
+const modelDivId = (b) => (typeof b.label == "number" && MOCK_DIV_IDS[b.label]) ? MOCK_DIV_IDS[b.label] : b.label;
+// Editor property names that the model knows under another name
+const MODEL_STYLE_PROPS = { bgColor: 'backgroundColor' };
+
 export default function Dashboard({ user, token, repo, onBack }) {
   const [viewMode, setViewMode] = useState('simulation'); 
   const [totalUsers, setTotalUsers] = useState(0);
@@ -389,6 +395,7 @@ export default function Dashboard({ user, token, repo, onBack }) {
   const [clicksData, setClicksData] = useState({}); 
   const [aiLog, setAiLog] = useState([{ role: 'system', text: `Connected to ${repo?.full_name}` }]);
   const [demoMode, setDemoMode] = useState(true); 
+  const pageStateId = useRef(null);
   const [darkMode, setDarkMode] = useState(true); 
   
   const [rightPanelWidth, setRightPanelWidth] = useState(480);
@@ -442,7 +449,36 @@ export default function Dashboard({ user, token, repo, onBack }) {
   }, []);
 
   const colorToHex = (c) => { if (!c) return '#000000'; if (typeof c !== 'string') return '#000000'; if (c.startsWith('#')) return c; const m = c.match(/rgb\((\d+),\s*(\d+),\s*(\d+)\)/); if (m) return '#'+[1,2,3].map(i => parseInt(m[i]).toString(16).padStart(2,'0')).join(''); return '#000000'; };
-  const handleStyleChange = (id, prop, value) => { setBubbles(prev => prev.map(b => b.id === id ? { ...b, meta: { ...(b.meta || {}), [prop]: value } } : b)); try { window.postMessage({ type: 'UPDATE_STYLE', index: id, attr: prop, value}, '*'); } catch (e) {} };
+  const handleStyleChange = (id, prop, value) => { setBubbles(prev => prev.map(b => b.id === id ? { ...b, meta: { ...(b.meta || {}), [prop]: value } } : b)); try { window.postMessage({ type: 'UPDATE_STYLE', index: id, attr: prop, value}, '*'); } catch (e) {} if (demoMode) sendStyleDelta(id, prop, value); };
+
+  // Editable copy of the page on the server (on the repo's model), so style edits can be scored one element at a time
+  const openPageState = async () => {
+      const pageResp = await fetch(APP_HOST + BACKEND_PORT + '/api/page_state', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ repo_id: repo?.full_name }) });
+      pageStateId.current = pageResp.ok ? (await pageResp.json())?.page_id || null : null;
+      return pageStateId.current;
+  };
+
+  // Demo mode: send the single edit to the server-side page state, which re-encodes only that element
+  const sendStyleDelta = async (id, prop, value) => {
+      const bubble = bubbles.find(b => b.id === id);
+      if (!bubble || !pageStateId.current) return;
+      // The model was trained on plain pixel numbers
+      const modelValue = (typeof value === 'string' && /^-?\d+(\.\d+)?px$/.test(value)) ? parseFloat(value) : value;
+      const sendEdit = (pageId) => fetch(APP_HOST + BACKEND_PORT + `/api/page_state/${pageId}/style`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ div_id: modelDivId(bubble), prop: MODEL_STYLE_PROPS[prop] || prop, value: modelValue, x: bubble.meta?.x || 0, y: bubble.meta?.y || 0 })
+      });
+      try {
+          let resp = await sendEdit(pageStateId.current);
+          // The server dropped the page (its model was evicted or reloaded away): open a new one and retry once
+          if (resp.status === 404 && await openPageState()) resp = await sendEdit(pageStateId.current);
+          if (resp.ok) {
+              const json = await resp.json();
+              if (typeof json?.count === 'number') setBubbles(prev => prev.map(b => b.id === id ? { ...b, count: json.count } : b));
+          }
+      } catch (e) { console.error(e); }
+  };
 
   const handleDeleteBubble = (id) => { if (activeId === id) setActiveId(null); setBubbles(prev => prev.filter(b => b.id !== id)); };
   const toggleVisibility = (id) => { setBubbles(prev => prev.map(b => b.id === id ? { ...b, visible: !b.visible } : b)); };
@@ -457,36 +493,40 @@ export default function Dashboard({ user, token, repo, onBack }) {
   const fetchModelPredictions = useCallback(async (currentBubbles) => {
       setAiLog(prev => [...prev, { role: 'system', text: 'Fetching AI Model predictions...' }]);
       
-      const newBubbles = await Promise.all(currentBubbles.map(async (b) => {
-          let id = b.label;
-          // Map ID numbers to strings if needed (legacy support)
-          if (typeof id == "number") {
-             const mockIds = ["nav-main", "hero-text", "btn-cta", "description", "btn-cta-2"];
-             if(mockIds[id]) id = mockIds[id];
-          }
-          
-          try {
-              const resp = await fetch(APP_HOST + BACKEND_PORT + '/api/get_hit_count', { 
-                  method: 'POST', 
-                  headers: { 'Content-Type': 'application/json' }, 
-                  body: JSON.stringify({ 
+      const divIds = currentBubbles.map(modelDivId);
+
+      // One request (and one forward pass) for every tracked element
+      let newBubbles = currentBubbles;
+      try {
+          const resp = await fetch(APP_HOST + BACKEND_PORT + '/api/get_hit_counts', { 
+              method: 'POST', 
+              headers: { 'Content-Type': 'application/json' }, 
+              body: JSON.stringify({ 
+                  queries: currentBubbles.map((b, i) => ({ 
                       x: b.meta?.x || 0, 
                       y: b.meta?.y || 0, 
-                      div_id: id 
-                  }) 
-              });
-              if (!resp.ok) return b;
+                      div_id: divIds[i] 
+                  })),
+                  repo_id: repo?.full_name
+              }) 
+          });
+          if (resp.ok) {
               const json = await resp.json();
-              if (typeof json?.count === 'number') {
-                  return { ...b, count: json.count };
+              if (Array.isArray(json?.counts)) {
+                  newBubbles = currentBubbles.map((b, i) => typeof json.counts[i] === 'number' ? { ...b, count: json.counts[i] } : b);
               }
-          } catch(e) { console.error(e); }
-          return b;
-      }));
+          }
+          if (!pageStateId.current) await openPageState();
+      } catch(e) { console.error(e); }
       
       setBubbles(newBubbles);
       setAiLog(prev => [...prev, { role: 'success', text: 'Model data loaded.' }]);
-  }, []);
+  }, [repo?.full_name]);
+
+  // Pages are opened on one repo's model; a new repo gets its own page on the next model fetch
+  useEffect(() => {
+      pageStateId.current = null;
+  }, [repo?.full_name]);
 
   // --- UPDATED EFFECT: MODE SWITCHING ---
   useEffect(() => {
@@ -626,22 +666,59 @@ export default function Dashboard({ user, token, repo, onBack }) {
 const handleAiGenerate = async () => {
   if (!aiPrompt.trim()) return;
   setIsAiGenerating(true);
-  const apiUrl = `${APP_HOST}${PORT}/api/generate_code`;
+  const apiUrl = `${APP_HOST}${PORT}/api/generate_code_stream`;
   
   try {
       const currentCode = fileContents['src/App.jsx'] || '';
       setAiLog(prev => [...prev, { role: 'system', text: `Requesting AI changes...` }]);
 
-      const resp = await fetch(apiUrl, {
+      const request = {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify({ prompt: aiPrompt, code: currentCode })
-      });
+      };
+      const resp = await fetch(apiUrl, request);
+
+      // Backends without the streaming route answer with the whole code at once
+      if (resp.status === 404 || !(resp.headers.get('content-type') || '').includes('text/event-stream')) {
+          const fallback = resp.status === 404 ? await fetch(`${APP_HOST}${PORT}/api/generate_code`, request) : resp;
+          if (!fallback.ok) throw new Error("Backend Error");
+          const json = await fallback.json();
+          if (json?.code) {
+              setProposedCode(json.code);
+              setAiLog(prev => [...prev, { role: 'success', text: 'AI generated new code. Review above!' }]);
+          }
+          return;
+      }
+      if (!resp.ok || !resp.body) throw new Error("Backend Error");
+
+      // Server-sent events: show the code in the editor as it is generated
+      const reader = resp.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let code = '';
+      let done = false;
+      while (!done) {
+          const { value, done: streamDone } = await reader.read();
+          if (streamDone) break;
+          buffer += decoder.decode(value, { stream: true });
+          const events = buffer.split('\n\n');
+          buffer = events.pop();
+          for (const evt of events) {
+              const lines = evt.split('\n');
+              const type = (lines.find(l => l.startsWith('event: ')) || 'event: message').slice(7);
+              const dataLine = lines.find(l => l.startsWith('data: '));
+              const data = dataLine ? JSON.parse(dataLine.slice(6)) : {};
+              if (type === 'error') throw new Error(data.detail || "Backend Error");
+              if (type === 'done') { done = true; break; }
+              if (data.text) {
+                  code += data.text;
+                  setProposedCode(code);
+              }
+          }
+      }
 
-      if (!resp.ok) throw new Error("Backend Error");
-      const data = await resp.json();
-      if (data.code) {
-          setProposedCode(data.code);
+      if (code) {
           setAiLog(prev => [...prev, { role: 'success', text: 'AI generated new code. Review above!' }]);
       }
   } catch (err) {
@@ -674,8 +751,8 @@ const handleAiGenerate = async () => {
            const mockIds = ["nav-main", "hero-text", "btn-cta", "description", "btn-cta-2"];
            if(mockIds[id]) id = mockIds[id];
         }
-    const resp = await fetch(APP_HOST + BACKEND_PORT + '/api/get_hit_count', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ x: newX, y: newY, div_id: id, predict_other: predict_other}) }); if (!resp.ok) return; const json = await resp.json(); if (typeof json?.count === 'number') setBubbles(prev => prev.map(b => b.label === id ? { ...b, count : json?.count} : b)) } catch (e) { console.error(e); } }; if (demoMode) fetchBackendCount(); 
-  }, [demoMode]);
+    const resp = await fetch(APP_HOST + BACKEND_PORT + '/api/get_hit_count', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ x: newX, y: newY, div_id: id, predict_other: predict_other, repo_id: repo?.full_name}) }); if (!resp.ok) return; const json = await resp.json(); if (typeof json?.count === 'number') setBubbles(prev => prev.map(b => b.label === id ? { ...b, count : json?.count} : b)) } catch (e) { console.error(e); } }; if (demoMode) fetchBackendCount(); 
+  }, [demoMode, repo?.full_name]);
 
   useEffect(() => {
     if (!extractedGhost) return;